@@ -0,0 +1,92 @@
+import logging
+import os
+
+from starlette.applications import Starlette
+from starlette.requests import ClientDisconnect, Request
+from starlette.responses import (
+    FileResponse,
+    JSONResponse,
+    PlainTextResponse,
+    Response,
+)
+from starlette.routing import Mount, Route
+from starlette.staticfiles import StaticFiles
+from starlette.types import Scope
+
+from app.services import document_store, page_tiles, tts
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+UPLOAD_ROUTE = "/_documents"
+
+
+class ImmutableStaticFiles(StaticFiles):
+    """Static files whose names change with their content, so clients may keep them forever."""
+
+    def file_response(
+        self,
+        full_path: str | os.PathLike[str],
+        stat_result: os.stat_result,
+        scope: Scope,
+        status_code: int = 200,
+    ) -> Response:
+        response = super().file_response(full_path, stat_result, scope, status_code)
+        response.headers["Cache-Control"] = IMMUTABLE_CACHE_CONTROL
+        return response
+
+
+async def page_tile(request: Request) -> Response:
+    """Serves a server-rendered page image, rendering and caching it on first request."""
+    digest = request.path_params["digest"]
+    if not document_store.DIGEST_PATTERN.fullmatch(digest):
+        return PlainTextResponse("Not found", status_code=404)
+    try:
+        path = await page_tiles.get_tile(
+            digest, request.path_params["page"], request.path_params["bucket"]
+        )
+    except (FileNotFoundError, ValueError):
+        return PlainTextResponse("Not found", status_code=404)
+    except Exception as e:
+        logging.exception(f"Error rendering page tile: {e}")
+        return PlainTextResponse("Failed to render page", status_code=500)
+    return FileResponse(path, headers={"Cache-Control": IMMUTABLE_CACHE_CONTROL})
+
+
+async def upload_document(request: Request) -> Response:
+    """Stores a PDF sent as the raw request body, streaming it straight to disk."""
+    content_length = request.headers.get("content-length", "")
+    if (
+        content_length.isdigit()
+        and int(content_length) > document_store.MAX_UPLOAD_BYTES
+    ):
+        limit = document_store.MAX_UPLOAD_BYTES // (1024 * 1024)
+        return JSONResponse(
+            {"error": f"The file is larger than {limit} MB."}, status_code=413
+        )
+    try:
+        digest = await document_store.store_stream(request.stream())
+    except document_store.UploadRejectedError as e:
+        return JSONResponse({"error": str(e)}, status_code=e.status_code)
+    except ClientDisconnect:
+        return Response(status_code=499)
+    return JSONResponse({"document_id": digest})
+
+
+api = Starlette(
+    routes=[
+        Route(UPLOAD_ROUTE, upload_document, methods=["POST"]),
+        Route(
+            f"{page_tiles.TILE_ROUTE}/{{digest}}/{{page:int}}/{{bucket:int}}",
+            page_tile,
+        ),
+        # Segment URLs name a cache key, but a segment evicted and synthesized
+        # again may differ from the one a browser kept, so these revalidate.
+        Mount(
+            tts.AUDIO_ROUTE,
+            app=StaticFiles(directory=tts.audio_cache.directory, check_dir=False),
+        ),
+        Mount(
+            tts.PREVIEW_ROUTE,
+            app=ImmutableStaticFiles(directory=tts.preview_dir(), check_dir=False),
+        ),
+    ]
+)
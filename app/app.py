@@ -1,4 +1,6 @@
 import reflex as rx
+from app.api import api
+from app.services import storage, tts
 from app.states.state import State
 from app.components.sidebar import sidebar
 from app.components.player_bar import player_bar
@@ -51,6 +53,12 @@ app = rx.App(
         rx.el.script("""
             pdfjsLib.GlobalWorkerOptions.workerSrc = "https://cdnjs.cloudflare.com/ajax/libs/pdf.js/3.11.174/pdf.worker.min.js";
             """),
+        rx.el.script(src="/reader.js"),
+        rx.el.script(src="/player.js"),
+        rx.el.script(src="/upload.js"),
     ],
+    api_transformer=api,
 )
+app.register_lifespan_task(tts.client_lifespan)
+app.register_lifespan_task(storage.storage_lifespan)
 app.add_page(index)
\ No newline at end of file
@@ -8,6 +8,13 @@ def loading_view(text: str) -> rx.Component:
     return rx.el.div(
         rx.spinner(class_name="w-8 h-8 text-violet-500"),
         rx.el.p(text, class_name="mt-4 text-lg text-gray-600"),
+        rx.cond(
+            AIState.queue_position > 0,
+            rx.el.p(
+                f"Waiting in queue (#{AIState.queue_position})",
+                class_name="mt-1 text-sm text-gray-500",
+            ),
+        ),
         class_name="flex flex-col items-center justify-center h-full text-center p-6",
     )
 
@@ -23,7 +30,7 @@ def summarizer_modal() -> rx.Component:
                 rx.radix.primitives.dialog.title("Document Summary"),
                 rx.radix.primitives.dialog.description(
                     rx.cond(
-                        AIState.is_summarizing,
+                        AIState.is_summarizing & (AIState.summary == ""),
                         loading_view("Generating summary..."),
                         rx.scroll_area(
                             rx.markdown(
@@ -49,7 +56,7 @@ def summarizer_modal() -> rx.Component:
             ),
         ),
         open=State.show_summarizer,
-        on_open_change=State.set_show_summarizer,
+        on_open_change=[State.set_show_summarizer, AIState.on_summarizer_open_change],
     )
 
 
@@ -199,7 +206,7 @@ def quiz_modal() -> rx.Component:
                             ),
                             on_click=rx.cond(
                                 AIState.quiz_submitted,
-                                AIState.generate_quiz(State.document_text),
+                                AIState.generate_quiz(State.document_id, True),
                                 AIState.submit_quiz,
                             ),
                             class_name="px-4 py-2 bg-violet-500 text-white rounded-md hover:bg-violet-600",
@@ -222,6 +229,18 @@ def quiz_modal() -> rx.Component:
     )
 
 
+def model_message_bubble(text: rx.Var[str]) -> rx.Component:
+    """The bubble for a model reply, which may still be streaming in."""
+    return rx.el.div(
+        rx.cond(
+            text == "",
+            loading_view("..."),
+            rx.markdown(text, class_name="prose prose-sm max-w-none text-gray-800"),
+        ),
+        class_name="bg-gray-100 p-3 rounded-lg max-w-lg",
+    )
+
+
 def chat_message_component(message: ChatMessage) -> rx.Component:
     """Component for a single chat message."""
     return rx.el.div(
@@ -231,17 +250,7 @@ def chat_message_component(message: ChatMessage) -> rx.Component:
                 message["text"],
                 class_name="bg-violet-500 text-white p-3 rounded-lg max-w-lg",
             ),
-            rx.el.div(
-                rx.cond(
-                    message["text"] == "",
-                    loading_view("..."),
-                    rx.markdown(
-                        message["text"],
-                        class_name="prose prose-sm max-w-none text-gray-800",
-                    ),
-                ),
-                class_name="bg-gray-100 p-3 rounded-lg max-w-lg",
-            ),
+            model_message_bubble(message["text"]),
         ),
         class_name=rx.cond(
             message["role"] == "user", "flex justify-end", "flex justify-start"
@@ -260,6 +269,13 @@ def chat_modal() -> rx.Component:
                 rx.radix.primitives.dialog.content(
                     rx.el.div(
                         rx.radix.primitives.dialog.title("Chat with Document"),
+                        rx.cond(
+                            AIState.history_tokens > 0,
+                            rx.el.span(
+                                f"~{AIState.history_tokens} history tokens",
+                                class_name="text-xs text-gray-400 mr-24",
+                            ),
+                        ),
                         rx.el.button(
                             rx.icon("minus", class_name="h-4 w-4"),
                             on_click=[
@@ -276,6 +292,13 @@ def chat_modal() -> rx.Component:
                                 rx.foreach(
                                     AIState.chat_history, chat_message_component
                                 ),
+                                rx.cond(
+                                    AIState.is_chatting,
+                                    rx.el.div(
+                                        model_message_bubble(AIState.streaming_reply),
+                                        class_name="flex justify-start",
+                                    ),
+                                ),
                                 class_name="space-y-4 p-4",
                             ),
                             type="always",
@@ -1,6 +1,24 @@
 import reflex as rx
 from app.states.state import State
 
+PROGRESS_INTERVAL_MS = 5000
+
+
+def _media_current_time(e: rx.Var) -> tuple[rx.Var[float]]:
+    return (rx.Var(f"{e}.target.currentTime", _var_type=float),)
+
+
+def _media_duration(e: rx.Var) -> tuple[rx.Var[float]]:
+    return (rx.Var(f"{e}.target.duration", _var_type=float),)
+
+
+class AudioPlayer(rx.el.Audio):
+    """An audio element exposing the media events the player reports to the server."""
+
+    on_time_update: rx.EventHandler[_media_current_time]
+    on_duration_change: rx.EventHandler[_media_duration]
+    on_ended: rx.EventHandler[rx.event.no_args_event_spec]
+
 
 def player_bar() -> rx.Component:
     """The audio player bar."""
@@ -28,18 +46,39 @@ def player_bar() -> rx.Component:
                 on_click=lambda: State.seek_audio(20),
                 disabled=State.is_generating_audio,
             ),
+            rx.cond(
+                State.is_generating_audio,
+                rx.el.button(
+                    rx.icon("x", class_name="h-5 w-5"),
+                    on_click=State.cancel_audio,
+                    title="Cancel audio generation",
+                    class_name="ml-4 text-gray-500 hover:text-gray-700",
+                ),
+            ),
+            rx.cond(
+                State.is_generating_audio & (State.audio_queue_position > 0),
+                rx.el.span(
+                    f"Queued (#{State.audio_queue_position})",
+                    class_name="ml-2 text-xs text-gray-500 whitespace-nowrap",
+                ),
+            ),
             class_name="flex items-center",
         ),
         rx.el.div(
-            rx.el.span(State.current_time_str, class_name="text-xs w-12 text-center"),
+            rx.el.span(
+                State.current_time_str,
+                id="audio-current-time",
+                class_name="text-xs w-12 text-center",
+            ),
             rx.el.input(
+                id="audio-slider",
                 type="range",
                 on_change=State.on_slider_change.throttle(100),
                 class_name="w-full mx-4 accent-violet-500",
                 min=0,
                 max=100,
                 default_value=State.audio_progress,
-                key=State.audio_url,
+                key=State.audio_session,
                 disabled=State.is_generating_audio,
             ),
             rx.el.span(State.duration_str, class_name="text-xs w-12 text-center"),
@@ -55,23 +94,47 @@ def player_bar() -> rx.Component:
                 class_name="mx-2",
             ),
             rx.el.button(
-                rx.icon("download", class_name="h-5 w-5"),
-                on_click=rx.download(
-                    url=rx.get_upload_url(State.audio_url), filename="audio.mp3"
+                rx.icon(
+                    rx.cond(State.reader_backend == "tiles", "server", "monitor"),
+                    class_name="h-5 w-5",
+                ),
+                on_click=State.toggle_reader_backend,
+                title=rx.cond(
+                    State.reader_backend == "tiles",
+                    "Pages rendered on the server",
+                    "Pages rendered in the browser",
+                ),
+                class_name="mr-2",
+            ),
+            rx.el.button(
+                rx.cond(
+                    State.is_preparing_download,
+                    rx.spinner(class_name="h-5 w-5"),
+                    rx.icon("download", class_name="h-5 w-5"),
                 ),
-                disabled=~State.audio_url,
+                on_click=State.download_audio,
+                disabled=~State.audio_session | State.is_preparing_download,
             ),
             class_name="flex items-center",
         ),
-        rx.el.audio(
-            src=rx.cond(State.audio_url, rx.get_upload_url(State.audio_url), ""),
+        AudioPlayer.create(
+            src=rx.cond(
+                State.audio_streamed | ~State.audio_url,
+                "",
+                rx.get_upload_url(State.audio_url),
+            ),
             id="audio-player",
-            key=State.audio_url,
-            custom_attrs={
-                "onTimeUpdate": State.on_time_update,
-                "onLoadedMetadata": State.on_duration_change,
-                "onEnded": State.on_ended,
-            },
+            key=State.audio_session,
+            custom_attrs={"data-session": State.audio_session},
+            on_time_update=State.on_time_update_callback.throttle(PROGRESS_INTERVAL_MS),
+            on_duration_change=State.on_duration_change_callback,
+            on_ended=State.on_ended,
+        ),
+        # Clicked by player.js when a streamed segment fails to load.
+        rx.el.button(
+            id="audio-segment-error",
+            on_click=State.on_segment_error.throttle(PROGRESS_INTERVAL_MS),
+            class_name="hidden",
         ),
         class_name="fixed bottom-0 left-80 right-0 h-16 bg-white border-t border-gray-200 flex items-center px-6 z-10",
     )
\ No newline at end of file
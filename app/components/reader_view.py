@@ -3,11 +3,14 @@ from app.states.state import State
 
 
 def pdf_page_canvas(page_num: int) -> rx.Component:
-    """A canvas for rendering a single PDF page."""
+    """A placeholder for a single PDF page, rasterized by the reader when in view."""
     return rx.el.div(
-        rx.el.canvas(id=f"pdf-canvas-{page_num}", class_name="shadow-lg"),
+        rx.el.canvas(
+            id=f"pdf-canvas-{page_num}", class_name="w-full h-full bg-white shadow-lg"
+        ),
         rx.el.div(id=f"text-layer-{page_num}", class_name="absolute top-0 left-0"),
-        class_name="relative",
+        custom_attrs={"data-page": page_num},
+        class_name="relative mx-auto",
     )
 
 
@@ -30,7 +33,8 @@ def reader_view() -> rx.Component:
                         class_name="absolute top-0 left-0 pointer-events-none",
                     ),
                     id="pdf-container",
-                    class_name="w-full h-full overflow-y-auto p-8 space-y-4 bg-gray-200",
+                    on_mount=State.open_reader,
+                    class_name="relative w-full h-full overflow-y-auto p-8 space-y-4 bg-gray-200",
                 ),
                 rx.el.div(
                     rx.icon("file-search", class_name="h-16 w-16 text-gray-300"),
@@ -1,6 +1,8 @@
 import reflex as rx
 from app.states.state import State
 from app.states.ai_state import AIState
+from app.api import UPLOAD_ROUTE
+from app.services.document_store import MAX_UPLOAD_BYTES
 
 
 def ai_tool_button(text: str, tool_name: str) -> rx.Component:
@@ -9,19 +11,19 @@ def ai_tool_button(text: str, tool_name: str) -> rx.Component:
         "reader": lambda: State.set_active_tab("reader"),
         "summarizer": [
             lambda: State.set_show_summarizer(True),
-            lambda: AIState.generate_summary(State.document_text),
+            lambda: AIState.generate_summary(State.document_id),
         ],
         "glossary": [
             lambda: State.set_show_glossary(True),
-            lambda: AIState.generate_glossary(State.document_text),
+            lambda: AIState.generate_glossary(State.document_id),
         ],
         "quiz": [
             lambda: State.set_show_quiz(True),
-            lambda: AIState.generate_quiz(State.document_text),
+            lambda: AIState.generate_quiz(State.document_id),
         ],
         "chat": [
             lambda: State.set_show_chat(True),
-            lambda: AIState.start_chat(State.document_text),
+            lambda: AIState.start_chat(State.document_id),
         ],
     }
     is_active = rx.cond(
@@ -115,34 +117,56 @@ def sidebar() -> rx.Component:
                 class_name="p-4 border-b border-gray-200",
             ),
             rx.el.div(
-                rx.upload.root(
-                    rx.el.div(
-                        rx.el.button(
-                            rx.icon("cloud_upload", class_name="mr-2"),
-                            "Upload PDF",
-                            class_name=rx.cond(
-                                State.uploading,
-                                "bg-violet-200 text-violet-700 font-semibold py-2 px-4 rounded-lg w-full flex items-center justify-center cursor-not-allowed",
-                                "bg-violet-500 hover:bg-violet-600 text-white font-semibold py-2 px-4 rounded-lg w-full flex items-center justify-center",
-                            ),
-                            disabled=State.uploading,
+                rx.el.div(
+                    rx.el.button(
+                        rx.icon("cloud_upload", class_name="mr-2"),
+                        "Upload PDF",
+                        on_click=rx.call_script(
+                            "document.getElementById('pdf-file-input').click()"
+                        ),
+                        class_name=rx.cond(
+                            State.uploading,
+                            "bg-violet-200 text-violet-700 font-semibold py-2 px-4 rounded-lg w-full flex items-center justify-center cursor-not-allowed",
+                            "bg-violet-500 hover:bg-violet-600 text-white font-semibold py-2 px-4 rounded-lg w-full flex items-center justify-center",
                         ),
-                        class_name="w-full",
+                        disabled=State.uploading,
                     ),
-                    id="pdf-upload",
-                    on_drop=State.handle_upload(
-                        rx.upload_files(upload_id="pdf-upload")
+                    rx.el.input(
+                        id="pdf-file-input",
+                        type="file",
+                        accept=".pdf,application/pdf",
+                        on_change=State.on_upload_started,
+                        custom_attrs={
+                            "data-max-bytes": MAX_UPLOAD_BYTES,
+                            "data-upload-url": UPLOAD_ROUTE,
+                        },
+                        class_name="hidden",
+                    ),
+                    rx.el.button(
+                        id="pdf-upload-done",
+                        on_click=rx.call_script(
+                            "window.readifyUpload.takeResult()",
+                            callback=State.on_upload_finished,
+                        ),
+                        class_name="hidden",
                     ),
+                    id="pdf-upload",
                     class_name="w-full p-4 border-dashed border-gray-300 rounded-lg text-center cursor-pointer hover:border-violet-500",
                 ),
                 rx.cond(
                     State.uploading,
                     rx.el.div(
-                        rx.el.progress(
-                            value=State.upload_progress, class_name="w-full"
-                        ),
-                        rx.el.p(
-                            "Uploading...", class_name="text-sm text-gray-500 mt-2"
+                        rx.el.progress(id="upload-progress", max=100, class_name="w-full"),
+                        rx.el.div(
+                            rx.el.p("Uploading...", class_name="text-sm text-gray-500"),
+                            rx.el.button(
+                                "Cancel",
+                                on_click=rx.call_script(
+                                    "window.readifyUpload.cancel()"
+                                ),
+                                class_name="text-sm text-violet-600 hover:underline",
+                            ),
+                            class_name="flex items-center justify-between mt-2",
                         ),
                         class_name="w-full mt-4",
                     ),
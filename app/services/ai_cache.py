@@ -0,0 +1,38 @@
+import json
+import logging
+import os
+import time
+from typing import Any
+
+from app.services.disk_cache import DiskCache, cache_key
+
+TTL_SECONDS = int(os.getenv("AI_CACHE_TTL_SECONDS", str(7 * 24 * 60 * 60)))
+results = DiskCache(
+    "ai-results", int(os.getenv("AI_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+)
+
+
+def result_key(document_id: str, tool: str, prompt_version: int, model: str) -> str:
+    return cache_key(document_id, tool, prompt_version, model)
+
+
+def get(key: str) -> Any | None:
+    """Returns a cached AI result, or None if there is none or it has expired."""
+    data = results.read(key, ".json")
+    if data is None:
+        return None
+    try:
+        entry = json.loads(data)
+    except json.JSONDecodeError as e:
+        logging.exception(f"Discarding unreadable AI cache entry {key}: {e}")
+        results.discard(key)
+        return None
+    if time.time() - entry["created_at"] > TTL_SECONDS:
+        results.discard(key)
+        return None
+    return entry["value"]
+
+
+def put(key: str, value: Any):
+    entry = {"created_at": time.time(), "value": value}
+    results.put(key, {".json": json.dumps(entry).encode()})
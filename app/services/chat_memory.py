@@ -0,0 +1,62 @@
+import math
+import os
+
+HISTORY_TOKEN_BUDGET = int(os.getenv("CHAT_HISTORY_TOKEN_BUDGET", "3000"))
+KEEP_RECENT_MESSAGES = int(os.getenv("CHAT_KEEP_RECENT_MESSAGES", "4"))
+# Gemini averages about four characters of English per token.
+CHARS_PER_TOKEN = 4
+COMPACT_PROMPT = "Below is a summary of an earlier conversation between a user and an assistant about a document, followed by the turns that came after it. Write an updated summary of the whole conversation in at most 200 words. Keep the user's questions, the facts and page references from the answers, and anything the user asked to be remembered.\n\nSUMMARY SO FAR:\n{summary}\n\nLATER TURNS:\n{turns}"
+
+
+def estimate_tokens(text: str) -> int:
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def history_tokens(summary: str, messages: list[dict]) -> int:
+    """Estimates the tokens of the history sent with the next turn."""
+    return estimate_tokens(summary) + sum(
+        estimate_tokens(message["text"]) for message in messages
+    )
+
+
+def build_history(summary: str, messages: list[dict]) -> list[dict]:
+    """Returns Gemini chat history: the rolling summary, then the verbatim turns."""
+    history = []
+    if summary:
+        history += [
+            {
+                "role": "user",
+                "parts": [f"Summary of our conversation so far: {summary}"],
+            },
+            {"role": "model", "parts": ["Understood."]},
+        ]
+    return history + [
+        {"role": message["role"], "parts": [message["text"]]} for message in messages
+    ]
+
+
+def compaction_end(messages: list[dict], budget: int = HISTORY_TOKEN_BUDGET) -> int:
+    """Returns how many leading messages to fold into the summary, or 0 if none.
+
+    Nothing is folded while the messages fit the budget. Past it, the oldest
+    whole turns are folded until the rest fit in half the budget, so compaction
+    runs every few turns rather than on every one. The most recent messages are
+    always kept verbatim.
+    """
+    tokens = [estimate_tokens(message["text"]) for message in messages]
+    if sum(tokens) <= budget:
+        return 0
+    end = 0
+    remaining = sum(tokens)
+    limit = len(messages) - KEEP_RECENT_MESSAGES
+    while end < limit and (remaining > budget // 2 or messages[end]["role"] != "user"):
+        remaining -= tokens[end]
+        end += 1
+    while end > 0 and messages[end - 1]["role"] == "user":
+        end -= 1
+    return end
+
+
+def compact_prompt(summary: str, messages: list[dict]) -> str:
+    turns = "\n".join(f"{message['role']}: {message['text']}" for message in messages)
+    return COMPACT_PROMPT.format(summary=summary or "(none)", turns=turns)
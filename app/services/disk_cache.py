@@ -0,0 +1,137 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from pathlib import Path
+
+from reflex.utils.prerequisites import get_states_dir
+
+# Kept out of the upload dir, which is served publicly at /_upload. Only the
+# subdirectories mounted in api.py are served, under CACHE_ROUTE.
+CACHE_DIR = os.getenv("DISK_CACHE_DIR", "")
+CACHE_ROUTE = "/_cache"
+
+
+def cache_dir() -> Path:
+    return Path(CACHE_DIR) if CACHE_DIR else get_states_dir() / "cache"
+
+
+def cache_key(*parts) -> str:
+    """Returns a stable digest for a tuple of JSON-serializable key parts."""
+    return hashlib.sha256(
+        json.dumps(parts, sort_keys=True, separators=(",", ":")).encode()
+    ).hexdigest()
+
+
+class DiskCache:
+    """A directory of cache entries evicted least-recently-used under a byte budget.
+
+    An entry is a set of files sharing a key, one per suffix (e.g. ".mp3" and
+    ".json"), stored in a subdirectory named after the key's first two
+    characters so no single directory grows too large. File mtimes double as
+    access times, so the LRU order survives restarts and is shared by every
+    worker using the same directory.
+
+    Its methods do blocking disk I/O, so async code calls them through
+    asyncio.to_thread; the in-memory index is guarded by a lock for that.
+    """
+
+    def __init__(self, name: str, max_bytes: int):
+        self.name = name
+        self.max_bytes = max_bytes
+        self._index: OrderedDict[str, int] | None = None
+        self._total_bytes = 0
+        self._lock = threading.RLock()
+
+    @property
+    def directory(self) -> Path:
+        directory = cache_dir() / self.name
+        directory.mkdir(parents=True, exist_ok=True)
+        return directory
+
+    def _load_index(self) -> OrderedDict[str, int]:
+        if self._index is None:
+            entries: dict[str, list[float]] = {}
+            for path in self.directory.glob("*/*"):
+                if path.name.startswith("."):
+                    continue
+                stat = path.stat()
+                entry = entries.setdefault(path.name.split(".", 1)[0], [0, 0])
+                entry[0] += stat.st_size
+                entry[1] = max(entry[1], stat.st_mtime)
+            self._index = OrderedDict(
+                (key, int(size))
+                for key, (size, _) in sorted(entries.items(), key=lambda e: e[1][1])
+            )
+            self._total_bytes = sum(self._index.values())
+        return self._index
+
+    def path(self, key: str, suffix: str) -> Path:
+        return self.directory / key[:2] / f"{key}{suffix}"
+
+    def get(self, key: str, suffix: str) -> Path | None:
+        """Returns the path of a cached file and marks its entry as recently used."""
+        path = self.path(key, suffix)
+        if not path.exists():
+            return None
+        now = time.time()
+        try:
+            os.utime(path, (now, now))
+        except FileNotFoundError:
+            return None
+        with self._lock:
+            index = self._load_index()
+            if key in index:
+                index.move_to_end(key)
+        return path
+
+    def read(self, key: str, suffix: str) -> bytes | None:
+        path = self.get(key, suffix)
+        if path is None:
+            return None
+        try:
+            return path.read_bytes()
+        except FileNotFoundError:
+            return None
+
+    def put(self, key: str, files: dict[str, bytes]):
+        """Writes an entry atomically, file by file, then evicts down to the budget."""
+        size = 0
+        for suffix, data in files.items():
+            path = self.path(key, suffix)
+            path.parent.mkdir(exist_ok=True)
+            tmp_path = path.parent / f".{uuid.uuid4().hex}.part"
+            tmp_path.write_bytes(data)
+            os.replace(tmp_path, path)
+            size += len(data)
+        with self._lock:
+            index = self._load_index()
+            self._total_bytes += size - index.pop(key, 0)
+            index[key] = size
+            self._evict()
+
+    def discard(self, key: str):
+        """Removes an entry, if present."""
+        with self._lock:
+            self._total_bytes -= self._load_index().pop(key, 0)
+        self._remove_files(key)
+
+    def _remove_files(self, key: str):
+        for path in (self.directory / key[:2]).glob(f"{key}.*"):
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logging.exception(f"Failed to evict {path}: {e}")
+
+    def _evict(self):
+        index = self._load_index()
+        while self._total_bytes > self.max_bytes and len(index) > 1:
+            key, size = index.popitem(last=False)
+            self._total_bytes -= size
+            self._remove_files(key)
@@ -0,0 +1,191 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import re
+import uuid
+from collections import OrderedDict
+from collections.abc import AsyncIterator
+from pathlib import Path
+
+import reflex as rx
+
+from app.services import storage
+from app.services.pdf_extraction import ExtractionResult, extract_document
+
+DOCUMENTS_DIR = "documents"
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(200 * 1024 * 1024)))
+PDF_MAGIC = b"%PDF-"
+DIGEST_PATTERN = re.compile("[0-9a-f]{64}")
+# Bumped whenever the extraction gains or changes fields, so older ones are redone.
+EXTRACTION_FORMAT = 2
+MAX_LOADED_DOCUMENTS = int(os.getenv("MAX_LOADED_DOCUMENTS", "8"))
+# Recently used extractions, shared by every session in this process. State only
+# keeps a document's id and fetches its text from here when a handler needs it.
+_loaded: OrderedDict[str, ExtractionResult] = OrderedDict()
+_pending_extractions: dict[str, asyncio.Task] = {}
+
+
+def documents_dir() -> Path:
+    directory = rx.get_upload_dir() / DOCUMENTS_DIR
+    directory.mkdir(parents=True, exist_ok=True)
+    return directory
+
+
+def document_artifact(digest: str) -> str:
+    """Returns a document's directory relative to the upload dir.
+
+    Each document gets its own directory, sharded by digest prefix, holding the
+    PDF and its extraction, so the storage manager can evict it as one unit.
+    """
+    return f"{DOCUMENTS_DIR}/{storage.shard(digest)}/{digest}"
+
+
+def _document_dir(digest: str, create: bool = False) -> Path:
+    # Document ids arrive from the browser, so only digests ever become paths.
+    if not DIGEST_PATTERN.fullmatch(digest):
+        raise ValueError(f"Invalid document id: {digest!r}")
+    directory = rx.get_upload_dir() / document_artifact(digest)
+    if create:
+        directory.mkdir(parents=True, exist_ok=True)
+    return directory
+
+
+def document_path(digest: str) -> Path:
+    return _document_dir(digest) / f"{digest}.pdf"
+
+
+def is_stored(digest: str) -> bool:
+    """Returns whether `digest` is a valid document id with a stored PDF."""
+    return bool(DIGEST_PATTERN.fullmatch(digest)) and document_path(digest).exists()
+
+
+def document_upload_name(digest: str) -> str:
+    """Returns the path of a stored document relative to the upload dir."""
+    return f"{document_artifact(digest)}/{digest}.pdf"
+
+
+def _extraction_path(digest: str) -> Path:
+    return _document_dir(digest) / f"{digest}.json"
+
+
+class UploadRejectedError(ValueError):
+    """An upload that is too large or not a PDF."""
+
+    def __init__(self, message: str, status_code: int):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+async def store_stream(
+    chunks: AsyncIterator[bytes], max_bytes: int = MAX_UPLOAD_BYTES
+) -> str:
+    """Streams an upload to disk while hashing it and stores it once by SHA-256 digest.
+
+    Only one network chunk is held in memory at a time, and the upload is
+    rejected as soon as it passes `max_bytes` or does not start like a PDF.
+    """
+    hasher = hashlib.sha256()
+    tmp_path = documents_dir() / f".{uuid.uuid4().hex}.part"
+    head = b""
+    size = 0
+    try:
+        with tmp_path.open("wb") as out:
+            async for chunk in chunks:
+                if len(head) < len(PDF_MAGIC):
+                    head += chunk[: len(PDF_MAGIC) - len(head)]
+                    if not PDF_MAGIC.startswith(head):
+                        raise UploadRejectedError("The file is not a PDF.", 415)
+                size += len(chunk)
+                if size > max_bytes:
+                    raise UploadRejectedError(
+                        f"The file is larger than {max_bytes // (1024 * 1024)} MB.", 413
+                    )
+                hasher.update(chunk)
+                out.write(chunk)
+        if head != PDF_MAGIC:
+            raise UploadRejectedError("The file is not a PDF.", 415)
+        digest = hasher.hexdigest()
+        target = _document_dir(digest, create=True) / f"{digest}.pdf"
+        if target.exists():
+            tmp_path.unlink()
+        else:
+            os.replace(tmp_path, target)
+        await storage.track(document_artifact(digest), "document")
+        return digest
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+
+
+def load_extraction(digest: str) -> ExtractionResult | None:
+    """Returns the persisted extraction for a document, if there is one."""
+    try:
+        with _extraction_path(digest).open("r", encoding="utf-8") as f:
+            data = json.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, json.JSONDecodeError) as e:
+        logging.exception(f"Discarding unreadable extraction for {digest}: {e}")
+        return None
+    if data.get("format") != EXTRACTION_FORMAT:
+        return None
+    return {
+        "page_count": data["page_count"],
+        "document_text": data["document_text"],
+        "sentences": [(text, i) for i, text in enumerate(data["sentences"])],
+        "sentence_to_page": dict(enumerate(data["sentence_pages"])),
+        "page_sizes": [tuple(size) for size in data["page_sizes"]],
+        "sentence_rects": data["sentence_rects"],
+    }
+
+
+def save_extraction(digest: str, result: ExtractionResult):
+    sentences = sorted(result["sentences"], key=lambda s: s[1])
+    data = {
+        "format": EXTRACTION_FORMAT,
+        "page_count": result["page_count"],
+        "document_text": result["document_text"],
+        "sentences": [text for text, _ in sentences],
+        "sentence_pages": [result["sentence_to_page"][i] for _, i in sentences],
+        "page_sizes": result["page_sizes"],
+        "sentence_rects": [result["sentence_rects"][i] for _, i in sentences],
+    }
+    path = _extraction_path(digest)
+    tmp_path = path.with_suffix(f".{uuid.uuid4().hex}.part")
+    with tmp_path.open("w", encoding="utf-8") as f:
+        json.dump(data, f, separators=(",", ":"))
+    os.replace(tmp_path, path)
+
+
+async def _extract_and_save(digest: str) -> ExtractionResult:
+    result = await extract_document(document_path(digest))
+    await asyncio.to_thread(save_extraction, digest, result)
+    await storage.track(document_artifact(digest), "document")
+    return result
+
+
+def _remember(digest: str, result: ExtractionResult) -> ExtractionResult:
+    _loaded[digest] = result
+    _loaded.move_to_end(digest)
+    while len(_loaded) > MAX_LOADED_DOCUMENTS:
+        _loaded.popitem(last=False)
+    return result
+
+
+async def get_extraction(digest: str) -> ExtractionResult:
+    """Returns a document's extraction from memory or disk, extracting it at most once."""
+    result = _loaded.get(digest)
+    if result is not None:
+        _loaded.move_to_end(digest)
+        return result
+    cached = await asyncio.to_thread(load_extraction, digest)
+    if cached is not None:
+        return _remember(digest, cached)
+    task = _pending_extractions.get(digest)
+    if task is None:
+        task = asyncio.create_task(_extract_and_save(digest))
+        _pending_extractions[digest] = task
+        task.add_done_callback(lambda _: _pending_extractions.pop(digest, None))
+    return _remember(digest, await asyncio.shield(task))
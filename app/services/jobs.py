@@ -0,0 +1,226 @@
+import asyncio
+import contextvars
+import itertools
+import logging
+import os
+from bisect import insort
+from collections import defaultdict
+from collections.abc import Awaitable, Callable
+from contextlib import asynccontextmanager, contextmanager
+from typing import TypedDict
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_STANDARD = 1
+PRIORITY_BULK = 2
+MAX_PER_SESSION = int(os.getenv("JOBS_MAX_PER_SESSION", "3"))
+# Queue positions are reported at most this often, however fast the queue moves.
+POSITION_REPORT_SECONDS = float(os.getenv("JOBS_POSITION_REPORT_SECONDS", "0.5"))
+
+
+class JobOwner(TypedDict):
+    session: str
+    on_position: Callable[[int], Awaitable[None]] | None
+    shared: bool
+
+
+class _Job(TypedDict):
+    priority: int
+    seq: int
+    session: str
+    tag: str
+    future: asyncio.Future
+    owner: JobOwner | None
+
+
+_owner: contextvars.ContextVar[JobOwner | None] = contextvars.ContextVar(
+    "job_owner", default=None
+)
+
+
+def set_owner(
+    session: str, on_position: Callable[[int], Awaitable[None]] | None = None
+):
+    """Attributes the jobs started from the current task to a client session.
+
+    `on_position` is awaited with the 1-based queue position of the earliest of
+    those jobs still waiting whenever it changes, and with 0 once none wait.
+    """
+    _owner.set({"session": session, "on_position": on_position, "shared": False})
+
+
+def shared_context() -> contextvars.Context:
+    """Returns a copy of the current context for work shared by several sessions.
+
+    Its jobs still count against the limit of the session that started the
+    work, but they are not cancelled with that session's jobs: the waiters on
+    shared work are, and the work is dropped once none are left.
+    """
+    context = contextvars.copy_context()
+    owner = _owner.get()
+    if owner:
+        context.run(_owner.set, {**owner, "shared": True})
+    return context
+
+
+async def _report(owner: JobOwner, position: int):
+    try:
+        await owner["on_position"](position)
+    except Exception as e:
+        logging.exception(f"Failed to report queue position: {e}")
+
+
+class JobScheduler:
+    """Admits upstream calls by priority under global and per-session limits.
+
+    Jobs wait in (priority, arrival) order. A job is skipped over, not blocked
+    behind, while its session is at its limit, so one session's burst cannot
+    hold back everyone else's interactive requests.
+    """
+
+    def __init__(self, name: str, max_running: int, max_per_session: int):
+        self.name = name
+        self.max_running = max_running
+        self.max_per_session = max_per_session
+        self._waiting: list[_Job] = []
+        self._running: defaultdict[str, int] = defaultdict(int)
+        self._running_total = 0
+        self._tasks: defaultdict[str, set[tuple[asyncio.Task, str]]] = defaultdict(set)
+        self._positions: dict[int, tuple[JobOwner, int]] = {}
+        self._report_handle: asyncio.TimerHandle | None = None
+        self._callbacks: set[asyncio.Task] = set()
+        self._seq = itertools.count()
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._waiting)
+
+    @asynccontextmanager
+    async def slot(self, priority: int = PRIORITY_STANDARD, tag: str = ""):
+        """Waits for a turn, then holds it for the body of the `async with`."""
+        owner = _owner.get()
+        session = owner["session"] if owner else ""
+        job: _Job = {
+            "priority": priority,
+            "seq": next(self._seq),
+            "session": session,
+            "tag": tag,
+            "future": asyncio.get_running_loop().create_future(),
+            "owner": owner,
+        }
+        insort(self._waiting, job, key=lambda j: (j["priority"], j["seq"]))
+        self._dispatch()
+        try:
+            await job["future"]
+        except asyncio.CancelledError:
+            if job in self._waiting:
+                self._waiting.remove(job)
+            elif job["future"].done() and not job["future"].cancelled():
+                self._release(session)
+            self._dispatch()
+            raise
+        try:
+            if owner and owner["shared"]:
+                yield
+            else:
+                with self.watch(tag):
+                    yield
+        finally:
+            self._release(session)
+            self._dispatch()
+
+    @contextmanager
+    def watch(self, tag: str = ""):
+        """Makes the current task cancellable with the session's jobs for its duration.
+
+        Jobs hold a slot while watched; a task waiting on shared work watches
+        without one.
+        """
+        owner = _owner.get()
+        session = owner["session"] if owner else ""
+        entry = (asyncio.current_task(), tag)
+        self._tasks[session].add(entry)
+        try:
+            yield
+        finally:
+            self._tasks[session].discard(entry)
+            if not self._tasks[session]:
+                del self._tasks[session]
+
+    def cancel(self, session: str, tag: str | None = None) -> int:
+        """Cancels a session's queued and running jobs, optionally only those with `tag`.
+
+        Shared work is left alone, queued or running: it ends once its last
+        waiter has gone.
+        """
+        cancelled = 0
+        for job in list(self._waiting):
+            if job["owner"] and job["owner"]["shared"]:
+                continue
+            if job["session"] == session and tag in (None, job["tag"]):
+                self._waiting.remove(job)
+                job["future"].cancel()
+                cancelled += 1
+        for task, job_tag in list(self._tasks.get(session, ())):
+            if tag in (None, job_tag):
+                task.cancel()
+                cancelled += 1
+        self._schedule_report()
+        return cancelled
+
+    def _release(self, session: str):
+        self._running_total -= 1
+        self._running[session] -= 1
+        if not self._running[session]:
+            del self._running[session]
+
+    def _dispatch(self):
+        for job in list(self._waiting):
+            if self._running_total >= self.max_running:
+                break
+            if job["future"].done():
+                continue
+            session = job["session"]
+            if session and self._running[session] >= self.max_per_session:
+                continue
+            self._waiting.remove(job)
+            self._running_total += 1
+            self._running[session] += 1
+            job["future"].set_result(None)
+        self._schedule_report()
+
+    def _schedule_report(self):
+        """Coalesces position reports, so draining a burst costs one per owner per interval."""
+        if self._report_handle is None and (self._waiting or self._positions):
+            self._report_handle = asyncio.get_running_loop().call_later(
+                POSITION_REPORT_SECONDS, self._report_positions
+            )
+
+    def _report_positions(self):
+        self._report_handle = None
+        positions: dict[int, tuple[JobOwner, int]] = {}
+        for position, job in enumerate(self._waiting, start=1):
+            owner = job["owner"]
+            if not owner or not owner["on_position"]:
+                continue
+            # Keyed by callback: shared work carries a copy of its starter's owner.
+            key = id(owner["on_position"])
+            if key not in positions:
+                positions[key] = (owner, position)
+        for key, (owner, _) in self._positions.items():
+            if key not in positions:
+                self._notify(owner, 0)
+        for key, (owner, position) in positions.items():
+            if key not in self._positions or self._positions[key][1] != position:
+                self._notify(owner, position)
+        self._positions = positions
+
+    def _notify(self, owner: JobOwner, position: int):
+        task = asyncio.create_task(_report(owner, position))
+        self._callbacks.add(task)
+        task.add_done_callback(self._callbacks.discard)
+
+
+tts_jobs = JobScheduler(
+    "tts", int(os.getenv("TTS_JOBS_MAX_RUNNING", "16")), MAX_PER_SESSION
+)
+ai_jobs = JobScheduler("ai", int(os.getenv("AI_MAX_CONCURRENCY", "4")), MAX_PER_SESSION)
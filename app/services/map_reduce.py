@@ -0,0 +1,144 @@
+import asyncio
+import hashlib
+import os
+from collections.abc import AsyncIterator
+
+from app.services import document_store, jobs
+from app.services.disk_cache import DiskCache, cache_key
+from app.services.retrieval import chunk_sentences
+from app.services.single_flight import SingleFlight
+
+SECTION_CHARS = int(os.getenv("AI_SECTION_CHARS", "24000"))
+PROMPT_VERSION = 1
+SUMMARY_MAP_PROMPT = "Summarize the key points of this part of a document in a few concise bullet points:\n\n{text}"
+SUMMARY_REDUCE_PROMPT = "These are summaries of consecutive parts of one document. Combine them into a single summary of the whole document in 3-5 key bullet points:\n\n{text}"
+SUMMARY_PROMPT = "Summarize the following document in 3-5 key bullet points:\n\n{text}"
+section_cache = DiskCache(
+    "ai-sections",
+    int(os.getenv("AI_SECTION_CACHE_MAX_BYTES", str(256 * 1024 * 1024))),
+)
+# Identical prompts from any number of sessions share one model call.
+_flights = SingleFlight(jobs.ai_jobs)
+
+
+async def split_sections(document_id: str, max_chars: int = SECTION_CHARS) -> list[str]:
+    """Splits a document into sections of whole sentences of about `max_chars`."""
+    extraction = await document_store.get_extraction(document_id)
+    return [chunk["text"] for chunk in chunk_sentences(extraction, max_chars)]
+
+
+async def generate(
+    model, prompt: str, priority: int = jobs.PRIORITY_STANDARD, tag: str = ""
+) -> str:
+    """Runs one model call as a job on the shared AI scheduler."""
+    async with jobs.ai_jobs.slot(priority, tag):
+        response = await model.generate_content_async(prompt)
+    return response.text
+
+
+async def stream(
+    model, prompt: str, priority: int = jobs.PRIORITY_STANDARD, tag: str = ""
+) -> AsyncIterator[str]:
+    """Streams one model call's text as a job on the shared AI scheduler."""
+    async with jobs.ai_jobs.slot(priority, tag):
+        response = await model.generate_content_async(prompt, stream=True)
+        async for chunk in response:
+            yield chunk.text
+
+
+def _prompt_key(model, prompt: str) -> str:
+    return cache_key(model.model_name, hashlib.sha256(prompt.encode()).hexdigest())
+
+
+async def generate_shared(
+    model, prompt: str, priority: int = jobs.PRIORITY_STANDARD, tag: str = ""
+) -> str:
+    """Like `generate`, sharing an identical call already in flight."""
+    return await _flights.run(
+        _prompt_key(model, prompt), lambda: generate(model, prompt, priority, tag), tag
+    )
+
+
+def stream_shared(
+    model, prompt: str, priority: int = jobs.PRIORITY_STANDARD, tag: str = ""
+) -> AsyncIterator[str]:
+    """Like `stream`, sharing an identical stream already in flight."""
+    return _flights.stream(
+        _prompt_key(model, prompt), lambda: stream(model, prompt, priority, tag), tag
+    )
+
+
+async def _map_section(
+    model, task: str, template: str, section: str, tag: str, refresh: bool
+) -> str:
+    key = cache_key(
+        task,
+        PROMPT_VERSION,
+        model.model_name,
+        hashlib.sha256(template.encode()).hexdigest(),
+        hashlib.sha256(section.encode()).hexdigest(),
+    )
+    cached = None
+    if not refresh:
+        cached = await asyncio.to_thread(section_cache.read, key, ".txt")
+    if cached is not None:
+        return cached.decode()
+    result = await generate_shared(model, template.format(text=section), tag=tag)
+    await asyncio.to_thread(section_cache.put, key, {".txt": result.encode()})
+    return result
+
+
+async def map_sections(
+    model,
+    task: str,
+    template: str,
+    sections: list[str],
+    tag: str = "",
+    refresh: bool = False,
+) -> list[str]:
+    """Runs `template` over every section concurrently, caching each section's result.
+
+    The section calls are scheduled as jobs tagged `tag`, or `task` if not given.
+    With `refresh`, cached results are ignored and replaced.
+    """
+    return list(
+        await asyncio.gather(
+            *(
+                _map_section(model, task, template, section, tag or task, refresh)
+                for section in sections
+            )
+        )
+    )
+
+
+async def summary_prompt(model, document_id: str) -> str:
+    """Returns the prompt for the final summary, mapping long documents section by section.
+
+    Short documents are summarized in one call. Longer ones are summarized per
+    section and the partial summaries are reduced, in groups, until they fit
+    into a single prompt.
+    """
+    sections = await split_sections(document_id)
+    if len(sections) <= 1:
+        return SUMMARY_PROMPT.format(text=sections[0] if sections else "")
+    partials = await map_sections(model, "summary", SUMMARY_MAP_PROMPT, sections)
+    while sum(len(partial) for partial in partials) > SECTION_CHARS:
+        groups = _group(partials, SECTION_CHARS)
+        if len(groups) == len(partials):
+            break
+        partials = await map_sections(
+            model, "summary-reduce", SUMMARY_REDUCE_PROMPT, groups, tag="summary"
+        )
+    return SUMMARY_REDUCE_PROMPT.format(text="\n\n".join(partials))
+
+
+def _group(texts: list[str], max_chars: int) -> list[str]:
+    groups: list[list[str]] = [[]]
+    size = 0
+    for text in texts:
+        if groups[-1] and size + len(text) > max_chars:
+            groups.append([])
+            size = 0
+        groups[-1].append(text)
+        size += len(text)
+    return ["\n\n".join(group) for group in groups]
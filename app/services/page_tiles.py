@@ -0,0 +1,59 @@
+import asyncio
+import os
+from pathlib import Path
+
+from app.services import document_store
+from app.services.disk_cache import DiskCache, cache_key
+from app.services.pdf_extraction import PILLOW_AVAILABLE, render_page
+
+TILE_ROUTE = "/_tiles"
+ZOOM_BUCKETS = (50, 75, 100, 125, 150, 200, 300)
+PIXEL_RATIO = float(os.getenv("PAGE_TILE_PIXEL_RATIO", "1.5"))
+IMAGE_FORMAT = "webp" if PILLOW_AVAILABLE else "png"
+CACHE_FORMAT = 1
+tile_cache = DiskCache(
+    "tiles", int(os.getenv("PAGE_TILE_CACHE_MAX_BYTES", str(1024 * 1024 * 1024)))
+)
+_pending_tiles: dict[str, asyncio.Task] = {}
+
+
+def zoom_bucket(zoom: int) -> int:
+    """Returns the smallest zoom bucket that is at least as sharp as `zoom`."""
+    for bucket in ZOOM_BUCKETS:
+        if bucket >= zoom:
+            return bucket
+    return ZOOM_BUCKETS[-1]
+
+
+def tile_base_url(digest: str) -> str:
+    """Returns the URL prefix under which a document's tiles are served."""
+    return f"{TILE_ROUTE}/{digest}"
+
+
+async def _render_tile(key: str, digest: str, page_num: int, bucket: int) -> Path:
+    data = await render_page(
+        document_store.document_path(digest),
+        page_num,
+        bucket / 100 * PIXEL_RATIO,
+        IMAGE_FORMAT,
+    )
+    await asyncio.to_thread(tile_cache.put, key, {f".{IMAGE_FORMAT}": data})
+    return tile_cache.path(key, f".{IMAGE_FORMAT}")
+
+
+async def get_tile(digest: str, page_num: int, bucket: int) -> Path:
+    """Returns the cached image of a page at a zoom bucket, rendering it at most once."""
+    if bucket not in ZOOM_BUCKETS:
+        raise ValueError(f"Unsupported zoom bucket {bucket}.")
+    if not document_store.document_path(digest).exists():
+        raise FileNotFoundError(digest)
+    key = cache_key(digest, page_num, bucket, PIXEL_RATIO, IMAGE_FORMAT, CACHE_FORMAT)
+    path = await asyncio.to_thread(tile_cache.get, key, f".{IMAGE_FORMAT}")
+    if path is not None:
+        return path
+    task = _pending_tiles.get(key)
+    if task is None:
+        task = asyncio.create_task(_render_tile(key, digest, page_num, bucket))
+        _pending_tiles[key] = task
+        task.add_done_callback(lambda _: _pending_tiles.pop(key, None))
+    return await asyncio.shield(task)
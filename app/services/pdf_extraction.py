@@ -0,0 +1,200 @@
+import asyncio
+import io
+import logging
+import math
+import multiprocessing
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import TypedDict
+
+import pymupdf
+
+try:
+    from PIL import Image
+
+    PILLOW_AVAILABLE = True
+except ImportError:
+    PILLOW_AVAILABLE = False
+
+MAX_WORKERS = int(os.getenv("PDF_EXTRACT_WORKERS", "0")) or min(4, os.cpu_count() or 1)
+PAGES_PER_CHUNK = int(os.getenv("PDF_EXTRACT_PAGES_PER_CHUNK", "16"))
+RECT_PRECISION = 10000
+SENTENCE_ENDS = re.compile("(?<!\\w\\.\\w.)(?<![A-Z][a-z]\\.)(?<=\\.|\\?|!)\\s+")
+_executor: ProcessPoolExecutor | None = None
+
+
+class PageText(TypedDict):
+    text: str
+    width: float
+    height: float
+    # One (x0, y0, x1, y1, line) box per whitespace-separated word of `text`.
+    words: list[tuple[float, float, float, float, int]]
+
+
+class ExtractionResult(TypedDict):
+    page_count: int
+    document_text: str
+    sentences: list[tuple[str, int]]
+    sentence_to_page: dict[int, int]
+    page_sizes: list[tuple[float, float]]
+    # Per sentence, its line boxes flattened as x0, y0, x1, y1 in units of
+    # 1/RECT_PRECISION of the page size, so they are independent of zoom.
+    sentence_rects: list[list[int]]
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    """Returns the shared, bounded pool used for PDF work."""
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(
+            max_workers=MAX_WORKERS, mp_context=multiprocessing.get_context("spawn")
+        )
+    return _executor
+
+
+def _reset_executor():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+    _executor = None
+
+
+def _open_document(path: str) -> pymupdf.Document:
+    doc = pymupdf.open(path)
+    if doc.needs_pass:
+        doc.close()
+        raise ValueError("The PDF is encrypted.")
+    return doc
+
+
+def _count_pages(path: str) -> int:
+    with _open_document(path) as doc:
+        return doc.page_count
+
+
+def _extract_page_range(path: str, start: int, stop: int) -> list[PageText]:
+    """Extracts the words, word boxes and size of pages [start, stop). Runs in a worker process."""
+    pages: list[PageText] = []
+    with _open_document(path) as doc:
+        for page_num in range(start, stop):
+            page = doc[page_num]
+            tokens = []
+            words = []
+            for x0, y0, x1, y1, word, block, line, _ in page.get_text("words"):
+                line_id = block * 10000 + line
+                for token in word.split():
+                    tokens.append(token)
+                    words.append((x0, y0, x1, y1, line_id))
+            pages.append(
+                {
+                    "text": " ".join(tokens),
+                    "width": round(page.rect.width, 2),
+                    "height": round(page.rect.height, 2),
+                    "words": words,
+                }
+            )
+    return pages
+
+
+def _sentence_rects(
+    words: list[tuple[float, float, float, float, int]], width: float, height: float
+) -> list[int]:
+    """Merges a sentence's word boxes into one box per line, normalized to the page."""
+    lines: dict[int, list[float]] = {}
+    for x0, y0, x1, y1, line_id in words:
+        box = lines.get(line_id)
+        if box is None:
+            lines[line_id] = [x0, y0, x1, y1]
+        else:
+            box[0], box[1] = min(box[0], x0), min(box[1], y0)
+            box[2], box[3] = max(box[2], x1), max(box[3], y1)
+    rects: list[int] = []
+    for x0, y0, x1, y1 in lines.values():
+        rects += [
+            round(x0 / width * RECT_PRECISION),
+            round(y0 / height * RECT_PRECISION),
+            round(x1 / width * RECT_PRECISION),
+            round(y1 / height * RECT_PRECISION),
+        ]
+    return rects
+
+
+def split_sentences(pages: list[PageText]) -> ExtractionResult:
+    """Splits per-page text into indexed sentences, their pages and their boxes."""
+    sentences: list[tuple[str, int]] = []
+    sentence_to_page: dict[int, int] = {}
+    sentence_rects: list[list[int]] = []
+    for page_num, page in enumerate(pages):
+        # Sentences only break at whitespace, so each one covers a run of words.
+        word_index = 0
+        for part in SENTENCE_ENDS.split(page["text"]):
+            word_count = len(part.split())
+            part = part.strip()
+            if not part:
+                continue
+            sentence_words = page["words"][word_index : word_index + word_count]
+            word_index += word_count
+            sentence_index = len(sentences)
+            sentences.append((part, sentence_index))
+            sentence_to_page[sentence_index] = page_num
+            sentence_rects.append(
+                _sentence_rects(sentence_words, page["width"], page["height"])
+            )
+    return {
+        "page_count": len(pages),
+        "document_text": " ".join(page["text"] for page in pages),
+        "sentences": sentences,
+        "sentence_to_page": sentence_to_page,
+        "page_sizes": [(page["width"], page["height"]) for page in pages],
+        "sentence_rects": sentence_rects,
+    }
+
+
+def _render_page(path: str, page_num: int, scale: float, image_format: str) -> bytes:
+    """Rasterizes one page to PNG or WebP bytes. Runs in a worker process."""
+    with _open_document(path) as doc:
+        if not 0 <= page_num < doc.page_count:
+            raise ValueError(f"Page {page_num} is out of range.")
+        pixmap = doc[page_num].get_pixmap(
+            matrix=pymupdf.Matrix(scale, scale), alpha=False
+        )
+    if image_format == "webp":
+        image = Image.frombytes("RGB", (pixmap.width, pixmap.height), pixmap.samples)
+        buffer = io.BytesIO()
+        image.save(buffer, "WEBP", quality=80, method=4)
+        return buffer.getvalue()
+    return pixmap.tobytes("png")
+
+
+async def _run(func, *args):
+    loop = asyncio.get_running_loop()
+    try:
+        return await loop.run_in_executor(_get_executor(), func, *args)
+    except BrokenProcessPool:
+        logging.exception("PDF worker pool died, restarting it.")
+        _reset_executor()
+        raise
+
+
+async def extract_document(path: str | Path) -> ExtractionResult:
+    """Extracts text and sentences from a PDF, fanning page chunks out to the pool."""
+    path = str(path)
+    page_count = await _run(_count_pages, path)
+    chunk_size = max(1, min(PAGES_PER_CHUNK, math.ceil(page_count / MAX_WORKERS)))
+    chunks = await asyncio.gather(
+        *(
+            _run(_extract_page_range, path, start, min(start + chunk_size, page_count))
+            for start in range(0, page_count, chunk_size)
+        )
+    )
+    return split_sentences([page for chunk in chunks for page in chunk])
+
+
+async def render_page(
+    path: str | Path, page_num: int, scale: float, image_format: str
+) -> bytes:
+    """Rasterizes a page in the PDF worker pool."""
+    return await _run(_render_page, str(path), page_num, scale, image_format)
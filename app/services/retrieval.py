@@ -0,0 +1,144 @@
+import asyncio
+import math
+import os
+import re
+from collections import Counter, OrderedDict
+from typing import TypedDict
+
+from app.services import document_store
+from app.services.pdf_extraction import ExtractionResult
+
+CHUNK_CHARS = int(os.getenv("RETRIEVAL_CHUNK_CHARS", "1200"))
+TOP_K = int(os.getenv("RETRIEVAL_TOP_K", "6"))
+MAX_CACHED_INDEXES = int(os.getenv("RETRIEVAL_MAX_CACHED_INDEXES", "16"))
+BM25_K1 = 1.5
+BM25_B = 0.75
+TOKEN_PATTERN = re.compile(r"\w+")
+STOPWORDS = frozenset(
+    "a an and are as at be but by for from has have in is it its of on or that the "
+    "their there this to was were what when where which who why will with how do "
+    "does did can could would should i you we they he she me my our your".split()
+)
+_indexes: OrderedDict[str, "ChunkIndex"] = OrderedDict()
+_pending_indexes: dict[str, asyncio.Task] = {}
+
+
+class Chunk(TypedDict):
+    text: str
+    first_page: int
+    last_page: int
+
+
+def tokenize(text: str) -> list[str]:
+    return [
+        token for token in TOKEN_PATTERN.findall(text.lower()) if token not in STOPWORDS
+    ]
+
+
+def chunk_sentences(
+    extraction: ExtractionResult, max_chars: int = CHUNK_CHARS
+) -> list[Chunk]:
+    """Groups consecutive sentences into chunks of about `max_chars`, keeping their pages."""
+    chunks: list[Chunk] = []
+    parts: list[str] = []
+    size = 0
+    first_page = last_page = 0
+    for text, index in extraction["sentences"]:
+        page = extraction["sentence_to_page"].get(index, 0)
+        if parts and size + len(text) > max_chars:
+            chunks.append(
+                {
+                    "text": " ".join(parts),
+                    "first_page": first_page,
+                    "last_page": last_page,
+                }
+            )
+            # Carry the last sentence over so an answer spanning the boundary
+            # survives, unless the next chunk would then start over its budget.
+            if len(parts[-1]) + 1 + len(text) <= max_chars:
+                parts = parts[-1:]
+                size = len(parts[0]) + 1
+                first_page = last_page
+            else:
+                parts = []
+                size = 0
+        if not parts:
+            first_page = page
+        parts.append(text)
+        size += len(text) + 1
+        last_page = page
+    if parts:
+        chunks.append(
+            {"text": " ".join(parts), "first_page": first_page, "last_page": last_page}
+        )
+    return chunks
+
+
+class ChunkIndex:
+    """An in-memory BM25 index over a document's chunks."""
+
+    def __init__(self, chunks: list[Chunk]):
+        self.chunks = chunks
+        self._term_counts = [Counter(tokenize(chunk["text"])) for chunk in chunks]
+        self._lengths = [sum(counts.values()) for counts in self._term_counts]
+        self._average_length = sum(self._lengths) / len(chunks) if chunks else 0
+        document_frequency: Counter[str] = Counter()
+        for counts in self._term_counts:
+            document_frequency.update(counts.keys())
+        self._idf = {
+            term: math.log(1 + (len(chunks) - df + 0.5) / (df + 0.5))
+            for term, df in document_frequency.items()
+        }
+
+    def search(self, query: str, k: int = TOP_K) -> list[Chunk]:
+        """Returns up to `k` chunks ranked by BM25 score, in document order."""
+        terms = [term for term in set(tokenize(query)) if term in self._idf]
+        if not terms:
+            return self.chunks[:k]
+        scores = []
+        for position, counts in enumerate(self._term_counts):
+            score = 0.0
+            norm = BM25_K1 * (
+                1 - BM25_B + BM25_B * self._lengths[position] / self._average_length
+            )
+            for term in terms:
+                tf = counts.get(term)
+                if tf:
+                    score += self._idf[term] * tf * (BM25_K1 + 1) / (tf + norm)
+            if score > 0:
+                scores.append((score, position))
+        best = sorted(scores, reverse=True)[:k]
+        return [self.chunks[position] for position in sorted(p for _, p in best)]
+
+
+def format_chunks(chunks: list[Chunk]) -> str:
+    """Renders retrieved chunks as prompt context labelled with 1-based page numbers."""
+    sections = []
+    for chunk in chunks:
+        first, last = chunk["first_page"] + 1, chunk["last_page"] + 1
+        label = f"Page {first}" if first == last else f"Pages {first}-{last}"
+        sections.append(f"[{label}]\n{chunk['text']}")
+    return "\n\n".join(sections)
+
+
+async def _build_index(document_id: str) -> ChunkIndex:
+    extraction = await document_store.get_extraction(document_id)
+    index = await asyncio.to_thread(ChunkIndex, chunk_sentences(extraction))
+    _indexes[document_id] = index
+    while len(_indexes) > MAX_CACHED_INDEXES:
+        _indexes.popitem(last=False)
+    return index
+
+
+async def get_index(document_id: str) -> ChunkIndex:
+    """Returns the chunk index of a document, building it at most once."""
+    index = _indexes.get(document_id)
+    if index is not None:
+        _indexes.move_to_end(document_id)
+        return index
+    task = _pending_indexes.get(document_id)
+    if task is None:
+        task = asyncio.create_task(_build_index(document_id))
+        _pending_indexes[document_id] = task
+        task.add_done_callback(lambda _: _pending_indexes.pop(document_id, None))
+    return await asyncio.shield(task)
@@ -0,0 +1,97 @@
+import asyncio
+import contextlib
+from collections.abc import AsyncIterator, Awaitable, Callable
+from typing import TypeVar
+
+from app.services import jobs
+
+T = TypeVar("T")
+
+
+class _Call:
+    def __init__(self, key: str):
+        self.key = key
+        self.task: asyncio.Task | None = None
+        self.waiters = 0
+        self.text = ""
+        self.updated = asyncio.Event()
+
+
+async def _collect(call: _Call, chunks: AsyncIterator[str]):
+    async with contextlib.aclosing(chunks):
+        async for text in chunks:
+            call.text += text
+            call.updated.set()
+            call.updated = asyncio.Event()
+
+
+class SingleFlight:
+    """Coalesces concurrent calls with the same key into one shared upstream call.
+
+    The call runs in its own task, counted against the limits of the session
+    that started it, and every caller waiting on the key gets its result.
+    Callers are cancelled with their session's jobs on `scheduler`; the shared
+    call is cancelled only once no callers are left waiting for it.
+    """
+
+    def __init__(self, scheduler: jobs.JobScheduler):
+        self.scheduler = scheduler
+        self._calls: dict[str, _Call] = {}
+
+    def _join(self, key: str, make: Callable[[_Call], Awaitable]) -> _Call:
+        call = self._calls.get(key)
+        if call is None:
+            call = _Call(key)
+            call.task = asyncio.create_task(make(call), context=jobs.shared_context())
+            call.task.add_done_callback(lambda _: self._finish(call))
+            self._calls[key] = call
+        call.waiters += 1
+        return call
+
+    def _finish(self, call: _Call):
+        if self._calls.get(call.key) is call:
+            del self._calls[call.key]
+        call.updated.set()
+
+    def _leave(self, call: _Call):
+        call.waiters -= 1
+        if not call.waiters and not call.task.done():
+            # Abandoned: later callers for the key start a fresh call.
+            self._finish(call)
+            call.task.cancel()
+
+    async def run(
+        self, key: str, factory: Callable[[], Awaitable[T]], tag: str = ""
+    ) -> T:
+        """Returns the result of `factory()`, sharing a call already in flight for `key`."""
+        call = self._join(key, lambda _: factory())
+        try:
+            with self.scheduler.watch(tag):
+                return await asyncio.shield(call.task)
+        finally:
+            self._leave(call)
+
+    async def stream(
+        self, key: str, factory: Callable[[], AsyncIterator[str]], tag: str = ""
+    ) -> AsyncIterator[str]:
+        """Yields the text streamed by `factory()`, sharing a stream already in flight for `key`.
+
+        A caller that joins late first receives everything streamed so far.
+        """
+        call = self._join(key, lambda call: _collect(call, factory()))
+        seen = 0
+        try:
+            with self.scheduler.watch(tag):
+                while True:
+                    updated = call.updated
+                    if seen < len(call.text):
+                        text = call.text[seen:]
+                        seen += len(text)
+                        yield text
+                    elif call.task.done():
+                        call.task.result()
+                        return
+                    else:
+                        await updated.wait()
+        finally:
+            self._leave(call)
@@ -0,0 +1,227 @@
+import asyncio
+import hashlib
+import logging
+import os
+import shutil
+import sqlite3
+import time
+from contextlib import asynccontextmanager, closing
+from pathlib import Path
+
+import reflex as rx
+from reflex.utils.prerequisites import get_states_dir
+
+# Kept out of the upload dir, which is served publicly at /_upload.
+INDEX_PATH = os.getenv("STORAGE_INDEX_PATH", "")
+QUOTA_BYTES = int(os.getenv("STORAGE_QUOTA_BYTES", str(20 * 1024 * 1024 * 1024)))
+SWEEP_INTERVAL_SECONDS = float(os.getenv("STORAGE_SWEEP_INTERVAL_SECONDS", "600"))
+# Seconds since last access after which an artifact of each kind is removed.
+KIND_TTL_SECONDS = {
+    "document": int(os.getenv("STORAGE_DOCUMENT_TTL_SECONDS", str(30 * 24 * 60 * 60))),
+    "audio": int(os.getenv("STORAGE_AUDIO_TTL_SECONDS", str(24 * 60 * 60))),
+    "legacy": int(os.getenv("STORAGE_LEGACY_TTL_SECONDS", str(7 * 24 * 60 * 60))),
+}
+# Top-level directories of the upload dir whose artifacts are tracked as they are
+# written. Anything else there was left by earlier releases, such as uploads and
+# audio stored at the top level, and is adopted as "legacy" by the first sweep.
+MANAGED_DIRS = {"documents", "audio"}
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS artifacts (
+    path TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    owner TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    accessed_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS artifacts_accessed_at ON artifacts (accessed_at);
+"""
+_initialized = False
+_adopted = False
+# Access times recorded since the last flush, written in one batch by the sweeper.
+# Only touched on the event loop; the sweeper's thread gets a snapshot.
+_touched: dict[str, float] = {}
+
+
+def shard(name: str) -> str:
+    """Returns the two-character shard directory for a hex name."""
+    return name[:2]
+
+
+def _connect() -> sqlite3.Connection:
+    global _initialized
+    path = Path(INDEX_PATH) if INDEX_PATH else get_states_dir() / "storage.sqlite3"
+    if not _initialized:
+        path.parent.mkdir(parents=True, exist_ok=True)
+    connection = sqlite3.connect(path, timeout=30)
+    if not _initialized:
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.executescript(_SCHEMA)
+        _initialized = True
+    return connection
+
+
+def _size(path: Path) -> int:
+    if path.is_dir():
+        return sum(child.stat().st_size for child in path.rglob("*") if child.is_file())
+    return path.stat().st_size
+
+
+def _owner_hash(owner: str) -> str:
+    return hashlib.sha256(owner.encode()).hexdigest() if owner else ""
+
+
+def _track(relative_path: str, kind: str, owner: str):
+    now = time.time()
+    try:
+        size = _size(rx.get_upload_dir() / relative_path)
+    except FileNotFoundError:
+        return
+    with closing(_connect()) as connection, connection:
+        connection.execute(
+            "INSERT INTO artifacts (path, kind, owner, size, created_at, accessed_at) "
+            "VALUES (?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT (path) DO UPDATE SET size = excluded.size, "
+            "accessed_at = excluded.accessed_at",
+            (relative_path, kind, _owner_hash(owner), size, now, now),
+        )
+
+
+async def track(relative_path: str, kind: str, owner: str = ""):
+    """Records an artifact under the upload dir, or refreshes its size and access time.
+
+    An artifact is a file or a directory that is evicted as one unit. The owner
+    is only stored hashed, as it is usually a client token.
+    """
+    await asyncio.to_thread(_track, relative_path, kind, owner)
+
+
+def touch(relative_path: str):
+    """Marks an artifact as recently used, as of the next flush."""
+    _touched[relative_path] = time.time()
+
+
+def _take_touched() -> dict[str, float]:
+    """Takes the access times recorded by `touch`; call it on the event loop."""
+    global _touched
+    touched, _touched = _touched, {}
+    return touched
+
+
+def flush(touched: dict[str, float]):
+    """Writes access times taken with `_take_touched` to the index."""
+    if not touched:
+        return
+    with closing(_connect()) as connection, connection:
+        connection.executemany(
+            "UPDATE artifacts SET accessed_at = max(accessed_at, ?) WHERE path = ?",
+            [(accessed_at, path) for path, accessed_at in touched.items()],
+        )
+
+
+def _adopt_legacy(connection: sqlite3.Connection) -> int:
+    """Indexes untracked top-level entries of the upload dir, aged by their mtime."""
+    upload_dir = rx.get_upload_dir()
+    if not upload_dir.is_dir():
+        return 0
+    tracked = {path for (path,) in connection.execute("SELECT path FROM artifacts")}
+    rows = []
+    for path in upload_dir.iterdir():
+        if path.name in MANAGED_DIRS or path.name in tracked:
+            continue
+        try:
+            size = _size(path)
+            mtime = path.stat().st_mtime
+        except FileNotFoundError:
+            continue
+        rows.append((path.name, "legacy", "", size, mtime, mtime))
+    connection.executemany(
+        "INSERT OR IGNORE INTO artifacts "
+        "(path, kind, owner, size, created_at, accessed_at) VALUES (?, ?, ?, ?, ?, ?)",
+        rows,
+    )
+    return len(rows)
+
+
+def _remove(relative_path: str):
+    path = rx.get_upload_dir() / relative_path
+    try:
+        if path.is_dir():
+            shutil.rmtree(path)
+        else:
+            path.unlink(missing_ok=True)
+    except OSError as e:
+        logging.exception(f"Failed to remove {path}: {e}")
+        return
+    if path.parent == rx.get_upload_dir():
+        return
+    try:
+        path.parent.rmdir()
+    except OSError:
+        pass
+
+
+def sweep(touched: dict[str, float]) -> int:
+    """Removes expired artifacts, then the least recently used ones over the quota.
+
+    The access times in `touched` are flushed first. Returns the number of
+    artifacts removed.
+    """
+    global _adopted
+    flush(touched)
+    now = time.time()
+    with closing(_connect()) as connection, connection:
+        if not _adopted:
+            adopted = _adopt_legacy(connection)
+            if adopted:
+                logging.info(f"Storage adopted {adopted} untracked legacy artifacts.")
+            _adopted = True
+        rows = connection.execute(
+            "SELECT path, kind, size, accessed_at FROM artifacts ORDER BY accessed_at"
+        ).fetchall()
+        total = sum(size for _, _, size, _ in rows)
+        removed = []
+        kept = []
+        for path, kind, size, accessed_at in rows:
+            ttl = KIND_TTL_SECONDS.get(kind)
+            if ttl is not None and accessed_at < now - ttl:
+                removed.append(path)
+                total -= size
+            else:
+                kept.append((path, size))
+        for path, size in kept:
+            if total <= QUOTA_BYTES:
+                break
+            removed.append(path)
+            total -= size
+        for path in removed:
+            _remove(path)
+        connection.executemany(
+            "DELETE FROM artifacts WHERE path = ?", [(path,) for path in removed]
+        )
+    return len(removed)
+
+
+async def _sweep_forever():
+    while True:
+        try:
+            removed = await asyncio.to_thread(sweep, _take_touched())
+            if removed:
+                logging.info(f"Storage sweep removed {removed} artifacts.")
+        except Exception as e:
+            logging.exception(f"Storage sweep failed: {e}")
+        await asyncio.sleep(SWEEP_INTERVAL_SECONDS)
+
+
+@asynccontextmanager
+async def storage_lifespan():
+    """Runs the storage sweeper for the lifetime of the app."""
+    task = asyncio.create_task(_sweep_forever())
+    try:
+        yield
+    finally:
+        task.cancel()
+        try:
+            await asyncio.to_thread(flush, _take_touched())
+        except Exception as e:
+            logging.exception(f"Failed to flush storage access times: {e}")
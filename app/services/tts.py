@@ -0,0 +1,440 @@
+import asyncio
+import base64
+import hashlib
+import json
+import logging
+import os
+import random
+import re
+import uuid
+from collections import deque
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import TypedDict
+
+import httpx
+
+from app.services import jobs
+from app.services.disk_cache import CACHE_ROUTE, DiskCache, cache_dir, cache_key
+from app.services.single_flight import SingleFlight
+
+try:
+    import h2  # noqa: F401
+
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+API_BASE_URL = os.getenv("TTS_API_BASE_URL", "https://texttospeech.googleapis.com")
+HTTP2 = os.getenv("TTS_HTTP2", "0") == "1"
+MAX_CONNECTIONS = int(os.getenv("TTS_MAX_CONNECTIONS", "32"))
+MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("TTS_MAX_KEEPALIVE_CONNECTIONS", "16"))
+TIMEOUT_SECONDS = float(os.getenv("TTS_TIMEOUT_SECONDS", "120"))
+CONNECT_TIMEOUT_SECONDS = float(os.getenv("TTS_CONNECT_TIMEOUT_SECONDS", "10"))
+MAX_RETRIES = int(os.getenv("TTS_MAX_RETRIES", "4"))
+RETRY_BACKOFF_SECONDS = float(os.getenv("TTS_RETRY_BACKOFF_SECONDS", "0.5"))
+RETRY_BACKOFF_MAX_SECONDS = float(os.getenv("TTS_RETRY_BACKOFF_MAX_SECONDS", "20"))
+RETRYABLE_STATUSES = {408, 429, 500, 502, 503, 504}
+MAX_CONCURRENCY = int(os.getenv("TTS_MAX_CONCURRENCY", "4"))
+MAX_SSML_BYTES = int(os.getenv("TTS_MAX_SSML_BYTES", "4800"))
+LOOKAHEAD_SECONDS = float(os.getenv("TTS_LOOKAHEAD_SECONDS", "120"))
+# Streaming synthesis stops after the playhead has not moved for this long.
+IDLE_SECONDS = float(os.getenv("TTS_IDLE_SECONDS", "300"))
+LANGUAGE_CODE = "en-US"
+AUDIO_CONFIG = {"audioEncoding": "MP3"}
+CACHE_FORMAT = 2
+PREVIEW_SSML = "<speak>Hello, this is a preview of my voice.</speak>"
+# Preview clips are served publicly, from a cache subdirectory mounted in api.py.
+PREVIEW_ROUTE = f"{CACHE_ROUTE}/previews"
+VOICE_ID_PATTERN = re.compile("[A-Za-z0-9-]+")
+# Identical synthesis requests from any number of sessions share one API call.
+_flights = SingleFlight(jobs.tts_jobs)
+_client: httpx.AsyncClient | None = None
+audio_cache = DiskCache(
+    "audio", int(os.getenv("TTS_CACHE_MAX_BYTES", str(2 * 1024**3)))
+)
+# The player fetches cached segments straight from the audio cache, which is
+# mounted publicly in api.py; segment URLs name a cache key, not a session.
+AUDIO_ROUTE = f"{CACHE_ROUTE}/{audio_cache.name}"
+_SSML_OVERHEAD = len("<speak></speak>")
+_MP3_BITRATES = {
+    3: [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    2: [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+}
+_MP3_SAMPLE_RATES = {
+    3: [44100, 48000, 32000],
+    2: [22050, 24000, 16000],
+    0: [11025, 12000, 8000],
+}
+
+
+class SsmlBatch(TypedDict):
+    ssml: str
+    first: int
+    last: int
+
+
+class AudioSegment(TypedDict):
+    """A synthesized batch; times[i] is when sentence sentences[i] starts."""
+
+    key: str
+    audio: bytes
+    times: list[float]
+    sentences: list[int]
+    start: float
+    duration: float
+
+
+def _escape(text: str) -> str:
+    return (
+        text.replace("&", "&amp;")
+        .replace("<", "&lt;")
+        .replace(">", "&gt;")
+        .replace('"', "&quot;")
+        .replace("'", "&apos;")
+    )
+
+
+def prepare_ssml(sentences: list[tuple[str, int]]) -> str:
+    """Wraps sentences in SSML <mark> tags."""
+    ssml_parts = ["<speak>"]
+    for sentence, i in sentences:
+        ssml_parts.append(f'<mark name="s{i}"/>{_escape(sentence)} ')
+    ssml_parts.append("</speak>")
+    return "".join(ssml_parts)
+
+
+def _sentence_fragments(sentence: str, index: int, max_bytes: int) -> list[str]:
+    """Returns the marked SSML for a sentence, split on words if it exceeds max_bytes."""
+    fragments = []
+    current = f'<mark name="s{index}"/>'
+    for word in sentence.split():
+        piece = _escape(word) + " "
+        if len(current.encode()) + len(piece.encode()) > max_bytes and current:
+            fragments.append(current)
+            current = ""
+        current += piece
+    if current:
+        fragments.append(current)
+    return fragments
+
+
+def batch_ssml(
+    sentences: list[tuple[str, int]], max_bytes: int = MAX_SSML_BYTES
+) -> list[SsmlBatch]:
+    """Packs sentences into SSML documents of at most max_bytes, split on sentence boundaries."""
+    budget = max_bytes - _SSML_OVERHEAD
+    batches: list[SsmlBatch] = []
+    current: list[str] = []
+    current_bytes = 0
+    first = last = -1
+    for sentence, i in sentences:
+        for fragment in _sentence_fragments(sentence, i, budget):
+            size = len(fragment.encode())
+            if current and current_bytes + size > budget:
+                batches.append(
+                    {
+                        "ssml": f"<speak>{''.join(current)}</speak>",
+                        "first": first,
+                        "last": last,
+                    }
+                )
+                current, current_bytes = [], 0
+            if not current:
+                first = i
+            current.append(fragment)
+            current_bytes += size
+            last = i
+    if current:
+        batches.append(
+            {"ssml": f"<speak>{''.join(current)}</speak>", "first": first, "last": last}
+        )
+    return batches
+
+
+def _skip_id3(data: bytes) -> int:
+    if data[:3] != b"ID3" or len(data) < 10:
+        return 0
+    size = (data[6] << 21) | (data[7] << 14) | (data[8] << 7) | data[9]
+    return 10 + size
+
+
+def mp3_duration(data: bytes) -> float:
+    """Returns the duration in seconds of an MPEG Layer III stream by walking its frames."""
+    pos = _skip_id3(data)
+    duration = 0.0
+    while pos + 4 <= len(data):
+        header = int.from_bytes(data[pos : pos + 4], "big")
+        version = (header >> 19) & 0x3
+        layer = (header >> 17) & 0x3
+        bitrate_index = (header >> 12) & 0xF
+        sample_rate_index = (header >> 10) & 0x3
+        if (
+            header >> 21 != 0x7FF
+            or version == 1
+            or layer != 1
+            or bitrate_index in (0, 15)
+            or sample_rate_index == 3
+        ):
+            pos += 1
+            continue
+        bitrate = _MP3_BITRATES[3 if version == 3 else 2][bitrate_index] * 1000
+        sample_rate = _MP3_SAMPLE_RATES[version][sample_rate_index]
+        padding = (header >> 9) & 0x1
+        samples = 1152 if version == 3 else 576
+        pos += samples // 8 * bitrate // sample_rate + padding
+        duration += samples / sample_rate
+    return duration
+
+
+def get_client() -> httpx.AsyncClient:
+    """Returns the process-wide HTTP client for the TTS backend."""
+    global _client
+    if _client is None or _client.is_closed:
+        if HTTP2 and not HTTP2_AVAILABLE:
+            logging.warning("TTS_HTTP2 is set but h2 is not installed, using HTTP/1.1.")
+        _client = httpx.AsyncClient(
+            base_url=API_BASE_URL,
+            http2=HTTP2 and HTTP2_AVAILABLE,
+            limits=httpx.Limits(
+                max_connections=MAX_CONNECTIONS,
+                max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+            ),
+            timeout=httpx.Timeout(TIMEOUT_SECONDS, connect=CONNECT_TIMEOUT_SECONDS),
+        )
+    return _client
+
+
+@asynccontextmanager
+async def client_lifespan():
+    """Closes the shared HTTP client when the app shuts down."""
+    try:
+        yield
+    finally:
+        if _client is not None:
+            await _client.aclose()
+
+
+def _retry_delay(attempt: int, response: httpx.Response | None) -> float:
+    """Full-jitter exponential backoff, honoring a numeric Retry-After header."""
+    if response is not None:
+        try:
+            return min(
+                float(response.headers["Retry-After"]), RETRY_BACKOFF_MAX_SECONDS
+            )
+        except (KeyError, ValueError):
+            pass
+    return random.uniform(
+        0, min(RETRY_BACKOFF_MAX_SECONDS, RETRY_BACKOFF_SECONDS * 2**attempt)
+    )
+
+
+async def _post(path: str, **kwargs) -> httpx.Response:
+    """POSTs to the TTS backend, retrying transport errors and retryable statuses."""
+    client = get_client()
+    attempt = 0
+    while True:
+        response = None
+        try:
+            response = await client.post(path, **kwargs)
+        except httpx.TransportError as e:
+            if attempt >= MAX_RETRIES:
+                raise
+            logging.warning(f"TTS request failed ({e!r}), retrying.")
+        else:
+            if response.status_code not in RETRYABLE_STATUSES or attempt >= MAX_RETRIES:
+                response.raise_for_status()
+                return response
+            logging.warning(f"TTS request returned {response.status_code}, retrying.")
+        await asyncio.sleep(_retry_delay(attempt, response))
+        attempt += 1
+
+
+async def synthesize_ssml(ssml: str, voice_id: str, with_timepoints: bool) -> dict:
+    """Calls the Google TTS text:synthesize endpoint and returns the decoded JSON."""
+    api_key = os.getenv("GOOGLE_CLOUD_API_KEY")
+    if not api_key:
+        raise ValueError("GOOGLE_CLOUD_API_KEY secret not set.")
+    data = {
+        "input": {"ssml": ssml},
+        "voice": {"languageCode": LANGUAGE_CODE, "name": voice_id},
+        "audioConfig": AUDIO_CONFIG,
+    }
+    if with_timepoints:
+        data["enableTimePointing"] = ["SSML_MARK"]
+    response = await _post(
+        "/v1beta1/text:synthesize", params={"key": api_key}, json=data
+    )
+    return response.json()
+
+
+def normalize_timepoints(timepoints: list[dict]) -> tuple[list[float], list[int]]:
+    """Converts API timepoints into parallel, time-ordered lists of times and sentence indices.
+
+    Mark names ("s12") are parsed once here; malformed marks are dropped.
+    """
+    pairs = []
+    for tp in timepoints:
+        try:
+            pairs.append((float(tp.get("timeSeconds", 0)), int(tp["markName"][1:])))
+        except (KeyError, ValueError, TypeError) as e:
+            logging.exception(f"Error parsing timepoint {tp}: {e}")
+    pairs.sort()
+    return [t for t, _ in pairs], [i for _, i in pairs]
+
+
+async def _synthesize_batch(
+    document_id: str, batch: SsmlBatch, voice_id: str
+) -> AudioSegment:
+    """Synthesizes one batch, serving it from the audio cache when possible.
+
+    A synthesis of the same batch already in flight for another session is
+    shared rather than repeated. The returned times are relative to the start
+    of the batch.
+    """
+    key = cache_key(
+        document_id,
+        voice_id,
+        batch["first"],
+        batch["last"],
+        LANGUAGE_CODE,
+        AUDIO_CONFIG,
+        hashlib.sha256(batch["ssml"].encode()).hexdigest(),
+        CACHE_FORMAT,
+    )
+    audio, metadata = await asyncio.gather(
+        asyncio.to_thread(audio_cache.read, key, ".mp3"),
+        asyncio.to_thread(audio_cache.read, key, ".json"),
+    )
+    if audio is not None and metadata is not None:
+        return {"key": key, "audio": audio, "start": 0.0, **json.loads(metadata)}
+    return await _flights.run(
+        key, lambda: _synthesize_uncached(key, batch, voice_id), "audio"
+    )
+
+
+async def _synthesize_uncached(
+    key: str, batch: SsmlBatch, voice_id: str
+) -> AudioSegment:
+    async with jobs.tts_jobs.slot(jobs.PRIORITY_BULK, "audio"):
+        response_data = await synthesize_ssml(batch["ssml"], voice_id, True)
+    audio = base64.b64decode(response_data["audioContent"])
+    times, sentence_indices = normalize_timepoints(response_data.get("timepoints", []))
+    segment: AudioSegment = {
+        "key": key,
+        "audio": audio,
+        "times": times,
+        "sentences": sentence_indices,
+        "start": 0.0,
+        "duration": mp3_duration(audio),
+    }
+    metadata = {
+        "times": times,
+        "sentences": sentence_indices,
+        "duration": segment["duration"],
+    }
+    await asyncio.to_thread(
+        audio_cache.put, key, {".mp3": audio, ".json": json.dumps(metadata).encode()}
+    )
+    return segment
+
+
+async def synthesize_segments(
+    document_id: str,
+    sentences: list[tuple[str, int]],
+    voice_id: str,
+    max_concurrency: int = MAX_CONCURRENCY,
+) -> AsyncIterator[AudioSegment]:
+    """Yields the synthesized SSML batches of a document in order, as each is ready.
+
+    At most max_concurrency batches are in flight or waiting to be consumed, so a
+    consumer that stops pulling also stops synthesis from running further ahead.
+    Times are shifted by the duration of the audio before their batch.
+    """
+    batches = batch_ssml(sentences)
+    pending: deque[asyncio.Task] = deque()
+    next_batch = 0
+    offset = 0.0
+    try:
+        while next_batch < len(batches) or pending:
+            while next_batch < len(batches) and len(pending) < max_concurrency:
+                pending.append(
+                    asyncio.create_task(
+                        _synthesize_batch(document_id, batches[next_batch], voice_id)
+                    )
+                )
+                next_batch += 1
+            segment = await pending.popleft()
+            yield {
+                "key": segment["key"],
+                "audio": segment["audio"],
+                "times": [offset + t for t in segment["times"]],
+                "sentences": segment["sentences"],
+                "start": offset,
+                "duration": segment["duration"],
+            }
+            offset += segment["duration"]
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+def segment_url(key: str) -> str:
+    """Returns the URL of a cached segment, relative to the backend."""
+    path = audio_cache.path(key, ".mp3")
+    return f"{AUDIO_ROUTE}/{path.parent.name}/{path.name}"
+
+
+def concat_segments(segments: list[bytes]) -> bytes:
+    """Joins MP3 segments into one stream, dropping the ID3 tags of all but the first."""
+    return b"".join(
+        audio if i == 0 else audio[_skip_id3(audio) :]
+        for i, audio in enumerate(segments)
+    )
+
+
+def preview_dir() -> Path:
+    directory = cache_dir() / "previews"
+    directory.mkdir(parents=True, exist_ok=True)
+    return directory
+
+
+def _preview_path(voice_id: str) -> Path:
+    if not VOICE_ID_PATTERN.fullmatch(voice_id):
+        raise ValueError(f"Invalid voice id: {voice_id!r}")
+    directory = preview_dir()
+    version = cache_key(PREVIEW_SSML, LANGUAGE_CODE, AUDIO_CONFIG)[:12]
+    return directory / f"{voice_id}-{version}.mp3"
+
+
+async def _generate_preview(voice_id: str, path: Path):
+    async with jobs.tts_jobs.slot(jobs.PRIORITY_INTERACTIVE, "preview"):
+        response_data = await synthesize_ssml(
+            PREVIEW_SSML, voice_id, with_timepoints=False
+        )
+    await asyncio.to_thread(
+        _save_preview, path, base64.b64decode(response_data["audioContent"])
+    )
+
+
+def _save_preview(path: Path, audio: bytes):
+    tmp_path = path.with_name(f".{uuid.uuid4().hex}.part")
+    tmp_path.write_bytes(audio)
+    os.replace(tmp_path, path)
+
+
+async def get_preview(voice_id: str) -> str:
+    """Returns the URL of a voice's preview clip, generating it once on first use.
+
+    Concurrent requests for the same voice share one generation. The file name
+    changes with the preview text and audio config, so it is served as immutable.
+    """
+    path = _preview_path(voice_id)
+    if not path.exists():
+        await _flights.run(
+            f"preview-{path.name}",
+            lambda: _generate_preview(voice_id, path),
+            "preview",
+        )
+    return f"{PREVIEW_ROUTE}/{path.name}"
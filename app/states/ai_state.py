@@ -1,10 +1,23 @@
 import reflex as rx
+import asyncio
+import contextlib
+import itertools
+import math
 import os
+import random
 import google.generativeai as genai
 import json
 import logging
 import re
+import time
 from typing import TypedDict, TypeVar
+from app.services import (
+    ai_cache,
+    chat_memory,
+    jobs,
+    map_reduce,
+    retrieval,
+)
 
 T = TypeVar("T")
 try:
@@ -13,6 +26,14 @@ try:
 except KeyError as e:
     GEMINI_AVAILABLE = False
     logging.exception(f"GEMINI_API_KEY not set. AI features will be disabled. {e}")
+CHAT_FLUSH_INTERVAL_SECONDS = float(os.getenv("CHAT_FLUSH_INTERVAL_SECONDS", "0.15"))
+CHAT_FLUSH_CHARS = int(os.getenv("CHAT_FLUSH_CHARS", "400"))
+
+MODEL_NAME = "gemini-2.0-flash"
+# Bump a tool's version whenever its prompt changes, so cached results are redone.
+PROMPT_VERSIONS = {"summary": 1, "glossary": 1, "quiz": 2}
+GLOSSARY_PROMPT = """\n            Extract key technical terms and acronyms from this text and provide definitions for each.\n            Format as a JSON array of objects, where each object has a 'term' and a 'definition' field.\n            Example: [{{"term": "AI", "definition": "Artificial Intelligence."}}]\n\n            Text: {text}\n            """
+QUIZ_PROMPT = "\n            Generate {count} multiple-choice questions based on this text.\n            Format as a JSON array of objects, where each object has:\n            - 'question': The question text (string).\n            - 'options': An array of 4 answer choices (list[str]).\n            - 'correct_answer': The index (0-3) of the correct option (int).\n            - 'explanation': A brief explanation of why the answer is correct (string).\n\n            Text: {text}\n            "
 
 
 class QuizQuestion(TypedDict):
@@ -39,6 +60,7 @@ class AIState(rx.State):
 
     summary: str = ""
     is_summarizing: bool = False
+    _summary_run: int = 0
     glossary: list[GlossaryTerm] = []
     is_generating_glossary: bool = False
     quiz: list[QuizQuestion] = []
@@ -46,19 +68,39 @@ class AIState(rx.State):
     quiz_score: int = 0
     quiz_submitted: bool = False
     chat_history: list[ChatMessage] = []
+    streaming_reply: str = ""
+    history_tokens: int = 0
+    _history_summary: str = ""
+    _summarized_count: int = 0
+    _chat_session: int = 0
+    _is_compacting: bool = False
     current_chat_message: str = ""
     is_chatting: bool = False
-    document_context: str = ""
+    chat_document_id: str = ""
+    queue_position: int = 0
 
     def _get_model(self):
         if not GEMINI_AVAILABLE:
             raise ConnectionError("Gemini API key not configured.")
-        return genai.GenerativeModel("gemini-2.0-flash")
+        return genai.GenerativeModel(MODEL_NAME)
+
+    def _track_jobs(self):
+        """Attributes the AI jobs of the running event to this client session."""
+        jobs.set_owner(self.router.session.client_token, self._report_queue_position)
+
+    async def _report_queue_position(self, position: int):
+        async with self:
+            self.queue_position = position
+
+    def _cache_key(self, document_id: str, tool: str) -> str:
+        return ai_cache.result_key(
+            document_id, tool, PROMPT_VERSIONS[tool], MODEL_NAME
+        )
 
     def _safe_json_parse(self, json_string: str, default: T) -> T:
         """Safely parses a JSON string, extracting it from markdown code blocks if necessary."""
         try:
-            match = re.search("(?:json)?\\s*([\\s\\S]*?)", json_string, re.DOTALL)
+            match = re.search("```(?:json)?\\s*([\\s\\S]*?)```", json_string, re.DOTALL)
             if match:
                 json_content = match.group(1).strip()
                 return json.loads(json_content)
@@ -85,41 +127,93 @@ class AIState(rx.State):
             return default
 
     @rx.event(background=True)
-    async def generate_summary(self, document_text: str):
-        """Generates a summary of the document."""
+    async def generate_summary(self, document_id: str):
+        """Streams a summary of the document, section by section for long ones."""
         async with self:
             if self.is_summarizing:
                 return
             self.is_summarizing = True
             self.summary = ""
+            self._summary_run += 1
+            run = self._summary_run
         yield
+        self._track_jobs()
         try:
+            cache_key = self._cache_key(document_id, "summary")
+            summary = await asyncio.to_thread(ai_cache.get, cache_key)
+            if summary is not None:
+                async with self:
+                    self.summary = summary
+                return
             model = self._get_model()
-            prompt = f"Summarize the following document in 3-5 key bullet points:\n\n{document_text[:28000]}"
-            response = await model.generate_content_async(prompt)
-            async with self:
-                self.summary = response.text
+            prompt = await map_reduce.summary_prompt(model, document_id)
+            summary = ""
+            async with contextlib.aclosing(
+                map_reduce.stream_shared(model, prompt, tag="summary")
+            ) as chunks:
+                async for text in chunks:
+                    summary += text
+                    async with self:
+                        if self._summary_run != run:
+                            return
+                        self.summary = summary
+                    yield
+            await asyncio.to_thread(ai_cache.put, cache_key, summary)
         except Exception as e:
             logging.exception(f"Error generating summary: {e}")
             yield rx.toast.error("Failed to generate summary.")
         finally:
             async with self:
-                self.is_summarizing = False
+                if self._summary_run == run:
+                    self.is_summarizing = False
+
+    @rx.event
+    def on_summarizer_open_change(self, is_open: bool):
+        """Stops a summary that is still streaming when its modal is closed."""
+        if not is_open and self.is_summarizing:
+            jobs.ai_jobs.cancel(self.router.session.client_token, "summary")
+            self._summary_run += 1
+            self.is_summarizing = False
+            self.summary = ""
+
+    async def _build_glossary(self, document_id: str) -> list[GlossaryTerm]:
+        """Extracts terms from every section of the document and merges them."""
+        model = self._get_model()
+        sections = await map_reduce.split_sections(document_id)
+        responses = await map_reduce.map_sections(
+            model, "glossary", GLOSSARY_PROMPT, sections
+        )
+        parsed_glossary = []
+        seen_terms = set()
+        for response_text in responses:
+            for item in self._safe_json_parse(response_text, []):
+                if not isinstance(item, dict):
+                    continue
+                term = str(item.get("term", "")).strip()
+                if term and term.lower() not in seen_terms:
+                    seen_terms.add(term.lower())
+                    parsed_glossary.append(
+                        {"term": term, "definition": item.get("definition", "")}
+                    )
+        return parsed_glossary
 
     @rx.event(background=True)
-    async def generate_glossary(self, document_text: str):
-        """Generates a glossary from the document."""
+    async def generate_glossary(self, document_id: str):
+        """Generates a glossary from every section of the document and merges it."""
         async with self:
             if self.is_generating_glossary:
                 return
             self.is_generating_glossary = True
             self.glossary = []
         yield
+        self._track_jobs()
         try:
-            model = self._get_model()
-            prompt = f"""\n            Extract key technical terms and acronyms from this text and provide definitions for each.\n            Format as a JSON array of objects, where each object has a 'term' and a 'definition' field.\n            Example: [{{"term": "AI", "definition": "Artificial Intelligence."}}]\n\n            Text: {document_text[:28000]}\n            """
-            response = await model.generate_content_async(prompt)
-            parsed_glossary = self._safe_json_parse(response.text, [])
+            cache_key = self._cache_key(document_id, "glossary")
+            parsed_glossary = await asyncio.to_thread(ai_cache.get, cache_key)
+            if parsed_glossary is None:
+                parsed_glossary = await self._build_glossary(document_id)
+                if parsed_glossary:
+                    await asyncio.to_thread(ai_cache.put, cache_key, parsed_glossary)
             async with self:
                 self.glossary = parsed_glossary
         except Exception as e:
@@ -130,8 +224,8 @@ class AIState(rx.State):
                 self.is_generating_glossary = False
 
     @rx.event(background=True)
-    async def generate_quiz(self, document_text: str):
-        """Generates a quiz based on the document."""
+    async def generate_quiz(self, document_id: str, new_questions: bool = False):
+        """Generates a quiz based on the document, reusing a cached one unless asked not to."""
         async with self:
             if self.is_generating_quiz:
                 return
@@ -140,12 +234,16 @@ class AIState(rx.State):
             self.quiz_submitted = False
             self.quiz_score = 0
         yield
+        self._track_jobs()
         try:
-            num_questions = min(10, max(3, len(document_text.split()) // 200))
-            model = self._get_model()
-            prompt = f"\n            Generate {num_questions} multiple-choice questions based on this text.\n            Format as a JSON array of objects, where each object has:\n            - 'question': The question text (string).\n            - 'options': An array of 4 answer choices (list[str]).\n            - 'correct_answer': The index (0-3) of the correct option (int).\n            - 'explanation': A brief explanation of why the answer is correct (string).\n\n            Text: {document_text[:28000]}\n            "
-            response = await model.generate_content_async(prompt)
-            parsed_quiz = self._safe_json_parse(response.text, [])
+            cache_key = self._cache_key(document_id, "quiz")
+            parsed_quiz = None
+            if not new_questions:
+                parsed_quiz = await asyncio.to_thread(ai_cache.get, cache_key)
+            if parsed_quiz is None:
+                parsed_quiz = await self._build_quiz(document_id, new_questions)
+                if parsed_quiz:
+                    await asyncio.to_thread(ai_cache.put, cache_key, parsed_quiz)
             for q in parsed_quiz:
                 q["user_answer"] = None
                 q["is_correct"] = None
@@ -158,6 +256,46 @@ class AIState(rx.State):
             async with self:
                 self.is_generating_quiz = False
 
+    async def _build_quiz(
+        self, document_id: str, new_questions: bool = False
+    ) -> list[QuizQuestion]:
+        """Asks the model for multiple-choice questions spread across the document.
+
+        At most one section per question is used: evenly spaced through the
+        document, or picked at random when new questions are asked for. The
+        questions are then taken from the sections in turn.
+        """
+        sections = await map_reduce.split_sections(document_id)
+        if not sections:
+            return []
+        words = sum(len(section.split()) for section in sections)
+        num_questions = min(10, max(3, words // 200))
+        if len(sections) > num_questions:
+            if new_questions:
+                picked = sorted(random.sample(range(len(sections)), num_questions))
+            else:
+                picked = [
+                    n * len(sections) // num_questions for n in range(num_questions)
+                ]
+            sections = [sections[i] for i in picked]
+        template = QUIZ_PROMPT.format(
+            count=math.ceil(num_questions / len(sections)), text="{text}"
+        )
+        responses = await map_reduce.map_sections(
+            self._get_model(), "quiz", template, sections, refresh=new_questions
+        )
+        per_section = [
+            [q for q in self._safe_json_parse(response_text, []) if isinstance(q, dict)]
+            for response_text in responses
+        ]
+        quiz = [
+            q
+            for questions in itertools.zip_longest(*per_section)
+            for q in questions
+            if q is not None
+        ]
+        return quiz[:num_questions]
+
     @rx.event
     def select_quiz_answer(self, question_index: int, answer_index: int):
         """Records the user's answer for a quiz question."""
@@ -178,15 +316,28 @@ class AIState(rx.State):
         self.quiz_score = score
         self.quiz_submitted = True
 
+    def _reset_chat_memory(self):
+        self.history_tokens = 0
+        self._history_summary = ""
+        self._summarized_count = 0
+        self._chat_session += 1
+
     @rx.event(background=True)
-    async def start_chat(self, document_text: str):
-        """Initializes the chat session with document context."""
+    async def start_chat(self, document_id: str):
+        """Initializes the chat session and indexes the document for retrieval."""
         async with self:
-            self.document_context = document_text
+            self.chat_document_id = document_id
             self.chat_history = []
+            self._reset_chat_memory()
             self.is_chatting = False
             self.current_chat_message = ""
         yield rx.toast.info("Chat initialized. Ask a question about the document!")
+        if not document_id:
+            return
+        try:
+            await retrieval.get_index(document_id)
+        except Exception as e:
+            logging.exception(f"Error indexing document for chat: {e}")
 
     @rx.event(background=True)
     async def send_chat_message(self, form_data: dict[str, str]):
@@ -197,34 +348,98 @@ class AIState(rx.State):
         async with self:
             self.is_chatting = True
             self.chat_history.append({"role": "user", "text": message_text})
-            self.chat_history.append({"role": "model", "text": ""})
+            self.streaming_reply = ""
             self.current_chat_message = ""
         yield
+        self._track_jobs()
+        reply = ""
         try:
             model = self._get_model()
             chat = model.start_chat(
-                history=[
-                    {"role": msg["role"], "parts": [msg["text"]]}
-                    for msg in self.chat_history[:-2]
-                ]
+                history=chat_memory.build_history(
+                    self._history_summary,
+                    self.chat_history[self._summarized_count : -1],
+                )
             )
-            context_prompt = f"\n            You are a helpful assistant. Use the following document context to answer the user's question.\n            If the answer isn't in the document, use your general knowledge but mention you are doing so.\n\n            DOCUMENT CONTEXT:\n            ---\n            {self.document_context[:25000]}\n            ---\n            USER QUESTION: {message_text}\n            "
-            response = await chat.send_message_async(context_prompt, stream=True)
-            current_response_text = ""
-            async for chunk in response:
-                current_response_text += chunk.text
-                async with self:
-                    self.chat_history[-1]["text"] = current_response_text
-                yield
+            # The previous question helps resolve follow-ups like "why is that?".
+            previous_questions = [
+                msg["text"] for msg in self.chat_history[:-1] if msg["role"] == "user"
+            ]
+            query = " ".join(previous_questions[-1:] + [message_text])
+            index = await retrieval.get_index(self.chat_document_id)
+            document_context = retrieval.format_chunks(index.search(query))
+            context_prompt = f"\n            You are a helpful assistant. Use the following excerpts from the document to answer the user's question.\n            Cite the page numbers of the excerpts you use, like (p. 3).\n            If the answer isn't in the excerpts, use your general knowledge but mention you are doing so.\n\n            DOCUMENT EXCERPTS:\n            ---\n            {document_context}\n            ---\n            USER QUESTION: {message_text}\n            "
+            async with jobs.ai_jobs.slot(jobs.PRIORITY_INTERACTIVE, "chat"):
+                response = await chat.send_message_async(context_prompt, stream=True)
+                # Chunks are flushed to the client in batches, and only through
+                # streaming_reply, so a long conversation is not re-sent per chunk.
+                flushed_chars = 0
+                last_flush = time.monotonic()
+                async for chunk in response:
+                    reply += chunk.text
+                    now = time.monotonic()
+                    if (
+                        not flushed_chars
+                        or now - last_flush >= CHAT_FLUSH_INTERVAL_SECONDS
+                        or len(reply) - flushed_chars >= CHAT_FLUSH_CHARS
+                    ):
+                        async with self:
+                            self.streaming_reply = reply
+                        yield
+                        flushed_chars = len(reply)
+                        last_flush = now
         except Exception as e:
             logging.exception(f"Error in chat: {e}")
-            error_message = "Sorry, I encountered an error. Please try again."
-            async with self:
-                self.chat_history[-1]["text"] = error_message
+            reply = "Sorry, I encountered an error. Please try again."
         finally:
             async with self:
+                self.chat_history.append({"role": "model", "text": reply})
+                self.streaming_reply = ""
                 self.is_chatting = False
+                recent = self.chat_history[self._summarized_count :]
+                self.history_tokens = chat_memory.history_tokens(
+                    self._history_summary, recent
+                )
+                compact = chat_memory.compaction_end(recent) > 0
             yield rx.call_script("document.getElementById('chat-input').form.reset()")
+            if compact:
+                yield AIState.compact_chat_history
+
+    @rx.event(background=True)
+    async def compact_chat_history(self):
+        """Folds the oldest chat turns into the rolling summary sent as history."""
+        async with self:
+            if self._is_compacting:
+                return
+            start = self._summarized_count
+            messages = self.chat_history[start:]
+            end = chat_memory.compaction_end(messages)
+            if not end:
+                return
+            self._is_compacting = True
+            session = self._chat_session
+            summary = self._history_summary
+        try:
+            model = self._get_model()
+            prompt = chat_memory.compact_prompt(summary, messages[:end])
+            jobs.set_owner(self.router.session.client_token)
+            new_summary = (
+                await map_reduce.generate(
+                    model, prompt, jobs.PRIORITY_BULK, "chat-compaction"
+                )
+            ).strip()
+            async with self:
+                if self._chat_session == session:
+                    self._history_summary = new_summary
+                    self._summarized_count = start + end
+                    self.history_tokens = chat_memory.history_tokens(
+                        new_summary, self.chat_history[self._summarized_count :]
+                    )
+        except Exception as e:
+            logging.exception(f"Error compacting chat history: {e}")
+        finally:
+            async with self:
+                self._is_compacting = False
 
     @rx.event
     def clear_ai_states(self):
@@ -233,6 +448,8 @@ class AIState(rx.State):
         self.glossary = []
         self.quiz = []
         self.chat_history = []
+        self.streaming_reply = ""
+        self._reset_chat_memory()
         self.is_summarizing = False
         self.is_generating_glossary = False
         self.is_generating_quiz = False
@@ -1,25 +1,79 @@
 import reflex as rx
-import PyPDF2
-import os
+import asyncio
 import logging
-import random
-import string
+import math
 import time
-import base64
 import json
 import re
-import httpx
+import uuid
 from typing import Optional, Any
 from app.states.ai_state import AIState
+from app.services import document_store, jobs, page_tiles, storage, tts
+from app.services.pdf_extraction import ExtractionResult
+
+
+# Seconds between checks of a paused playhead, in case a progress tick is missed.
+PLAYHEAD_POLL_SECONDS = 30
+# Audio sessions waiting on the playhead, with the time that wakes them.
+_playhead_waiters: dict[str, tuple[float, asyncio.Event]] = {}
+
+
+def _wake_playhead_waiter(session: str, current_time: float | None = None):
+    waiter = _playhead_waiters.get(session)
+    if waiter and (current_time is None or current_time >= waiter[0]):
+        waiter[1].set()
+
+
+def _audio_artifact(session: str) -> str:
+    """One directory per audio session, sharded and evicted as a unit."""
+    return f"audio/{storage.shard(session)}/{session}"
+
+
+def _write_file(path, data: bytes):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(data)
+
+
+async def _stitch_audio(
+    session: str,
+    document_id: str,
+    sentences: list[tuple[str, int]],
+    voice_id: str,
+    owner: str,
+) -> str:
+    """Writes a session's audio as one file in the upload dir and returns its path.
+
+    The segments come from the audio cache, which the player streams from, so
+    this only runs for a download or a browser that cannot stream MP3.
+    """
+    segments = [
+        segment["audio"]
+        async for segment in tts.synthesize_segments(document_id, sentences, voice_id)
+    ]
+    audio_artifact = _audio_artifact(session)
+    filename = f"{audio_artifact}/audio.mp3"
+    await asyncio.to_thread(
+        _write_file, rx.get_upload_dir() / filename, tts.concat_segments(segments)
+    )
+    await storage.track(audio_artifact, "audio", owner)
+    return filename
+
+
+def _highlight_data(result: ExtractionResult) -> dict:
+    """The per-sentence pages and boxes the player highlights from, sent once per audio session."""
+    return {
+        "pages": [result["sentence_to_page"].get(i, -1) for _, i in result["sentences"]],
+        "rects": result["sentence_rects"],
+    }
 
 
 class State(rx.State):
     """The app state."""
 
     uploaded_file: Optional[str] = None
+    document_id: str = ""
     uploading: bool = False
-    upload_progress: int = 0
-    document_text: str = ""
+    has_text: bool = False
     is_processing_pdf: bool = False
     pdf_page_count: int = 0
     active_tab: str = "reader"
@@ -31,20 +85,24 @@ class State(rx.State):
     ]
     selected_voice: str = "en-US-Chirp3-HD-Charon"
     audio_url: Optional[str] = None
+    audio_session: str = ""
+    audio_streamed: bool = False
     is_generating_audio: bool = False
+    audio_queue_position: int = 0
+    is_preparing_download: bool = False
     is_generating_preview: bool = False
     preview_voice_id: str = ""
     preview_audio_url: Optional[str] = None
     is_playing: bool = False
     audio_progress: float = 0
+    current_time: float = 0
     current_time_str: str = "00:00"
     duration: float = 0
     duration_str: str = "00:00"
     zoom_level: int = 100
-    sentences: list[tuple[str, int]] = []
-    sentence_to_page: dict[int, int] = {}
-    timepoints: list[dict[str, str | float]] = []
-    current_sentence_index: int = -1
+    reader_backend: str = "pdfjs"
+    _segments_sent: int = 0
+    _audio_idle: bool = False
     original_filename: str = ""
     show_summarizer: bool = False
     show_glossary: bool = False
@@ -55,82 +113,113 @@ class State(rx.State):
     @rx.event
     def zoom_in(self):
         self.zoom_level += 10
-        yield self._render_pdf_script()
+        return rx.call_script(f"window.readifyReader.setZoom({self.zoom_level})")
 
     @rx.event
     def zoom_out(self):
         self.zoom_level = max(50, self.zoom_level - 10)
-        yield self._render_pdf_script()
+        return rx.call_script(f"window.readifyReader.setZoom({self.zoom_level})")
+
+    @rx.event
+    async def open_reader(self):
+        """Hands the page layout to the virtualized reader once its pages mount."""
+        if not self.uploaded_file or not self.pdf_page_count:
+            return
+        storage.touch(document_store.document_artifact(self.document_id))
+        result = await document_store.get_extraction(self.document_id)
+        url = json.dumps(f"/_upload/{self.uploaded_file}")
+        sizes = json.dumps(result["page_sizes"])
+        tiles = "null"
+        if self.reader_backend == "tiles":
+            tiles = json.dumps(
+                {
+                    "base": page_tiles.tile_base_url(self.document_id),
+                    "buckets": page_tiles.ZOOM_BUCKETS,
+                }
+            )
+        return rx.call_script(
+            f"window.readifyReader.open({url}, {sizes}, {self.zoom_level}, {tiles})"
+        )
+
+    @rx.event
+    def toggle_reader_backend(self):
+        """Switches between rendering pages in the browser and on the server."""
+        self.reader_backend = "pdfjs" if self.reader_backend == "tiles" else "tiles"
+        return State.open_reader
 
     def _reset_audio_state(self):
+        _wake_playhead_waiter(self.audio_session)
         self.audio_url = None
         self.is_playing = False
         self.audio_progress = 0
         self.current_time_str = "00:00"
         self.duration = 0
         self.duration_str = "00:00"
-        self.timepoints = []
-        self.current_sentence_index = -1
+        self.current_time = 0
+        self.audio_session = ""
+        self.audio_streamed = False
+        self.audio_queue_position = 0
+        self._segments_sent = 0
+        self._audio_idle = False
+        self.is_preparing_download = False
 
     def _reset_pdf_state(self):
-        self.document_text = ""
+        self.document_id = ""
+        self.has_text = False
         self.is_processing_pdf = False
         self.pdf_page_count = 0
-        self.sentences = []
-        self.sentence_to_page = {}
 
     @rx.event
-    async def handle_upload(self, files: list[rx.UploadFile]):
-        if not files:
-            yield rx.toast.error("No file selected.")
+    def on_upload_started(self, filename: str):
+        """Shows upload progress; the browser streams the file to the upload route."""
+        if not filename:
             return
         self.uploading = True
-        self.upload_progress = 0
-        yield
-        file = files[0]
-        upload_data = await file.read()
-        self.upload_progress = 30
-        yield
-        upload_dir = rx.get_upload_dir()
-        upload_dir.mkdir(parents=True, exist_ok=True)
-        unique_name = (
-            "".join(random.choices(string.ascii_letters + string.digits, k=10))
-            + "_"
-            + file.name
-        )
-        file_path = upload_dir / unique_name
-        with file_path.open("wb") as f:
-            f.write(upload_data)
-        self.upload_progress = 60
-        yield
-        self.uploaded_file = unique_name
-        self.original_filename = file.name
-        self._reset_audio_state()
+
+    @rx.event
+    async def on_upload_finished(self, result: dict | None):
+        """Opens a document once the browser reports its upload has been stored."""
+        self.uploading = False
+        if not result or result.get("cancelled"):
+            return
+        if result.get("error"):
+            yield rx.toast.error(result["error"])
+            return
+        digest = result.get("document_id")
+        if not isinstance(digest, str) or not document_store.is_stored(digest):
+            yield rx.toast.error("The uploaded file could not be found.")
+            return
+        self.uploaded_file = document_store.document_upload_name(digest)
+        self.original_filename = result["filename"]
+        self._cancel_audio()
         self._reset_pdf_state()
+        self.document_id = digest
         self.is_processing_pdf = True
-        self.uploading = False
-        self.upload_progress = 100
         yield
         ai_state = await self.get_state(AIState)
         ai_state.clear_ai_states()
-        yield rx.toast.success(f"Uploaded {file.name}. Processing...")
+        yield rx.toast.success(f"Uploaded {result['filename']}. Processing...")
         yield State.process_pdf
 
     @rx.event(background=True)
     async def process_pdf(self):
-        """Extracts text and renders PDF using PDF.js."""
+        """Extracts text and page sizes on the server for the reader to lay out."""
         async with self:
-            if not self.uploaded_file:
+            if not self.document_id:
                 return
-            file_path = rx.get_upload_dir() / self.uploaded_file
+            document_id = self.document_id
         try:
-            with open(file_path, "rb") as f:
-                reader = PyPDF2.PdfReader(f)
-                num_pages = len(reader.pages)
+            result = await document_store.get_extraction(document_id)
             async with self:
-                self.pdf_page_count = num_pages
-            yield
-            yield self._render_pdf_script()
+                self.pdf_page_count = result["page_count"]
+                self.has_text = bool(result["document_text"].strip())
+                self.is_processing_pdf = False
+            if not self.has_text:
+                yield rx.toast.warning(
+                    "Document seems to be empty or contains only images."
+                )
+            else:
+                yield rx.toast.success("Document is ready!")
         except Exception as e:
             logging.exception(f"Error processing PDF: {e}")
             async with self:
@@ -139,143 +228,238 @@ class State(rx.State):
                 "Failed to process PDF. The file may be corrupt or encrypted."
             )
 
-    def _render_pdf_script(self) -> rx.event.EventSpec:
-        """Returns the script to render the PDF and extract text."""
-        return rx.call_script(
-            f"(async () => {{\n    try {{\n        if (typeof pdfjsLib === 'undefined' || !pdfjsLib.getDocument) {{\n            console.error('pdf.js is not loaded yet.');\n            return [null, [], {{}}, 'PDF library not available. Please refresh.'];\n        }}\n        const url = '/_upload/{self.uploaded_file}';\n        const pdfDoc = await pdfjsLib.getDocument(url).promise;\n        const allText = [];\n        const sentenceToPageMap = {{}};\n        const sentences = [];\n        const sentenceEnds = /(?<!\\w\\.\\w.)(?<![A-Z][a-z]\\.)(?<=\\.|\\?|!|\\n)\\s+/g;\n\n        let currentSentence = '';\n        let sentenceIndex = 0;\n\n        for (let i = 1; i <= {self.pdf_page_count}; i++) {{\n            const page = await pdfDoc.getPage(i);\n            const scale = {self.zoom_level} / 100;\n            const viewport = page.getViewport({{ scale }});\n            const canvas = document.getElementById(`pdf-canvas-${{i-1}}`);\n            if (!canvas) continue;\n            const context = canvas.getContext('2d');\n            canvas.height = viewport.height;\n            canvas.width = viewport.width;\n\n            const renderContext = {{ canvasContext: context, viewport: viewport }};\n            await page.render(renderContext).promise;\n\n            const textContent = await page.getTextContent();\n            const pageText = textContent.items.map(item => item.str).join('');\n\n            let textRuns = [];\n            let lastY = -1;\n            textContent.items.forEach(item => {{\n                if (textRuns.length === 0 || Math.abs(item.transform[5] - lastY) > 2) {{\n                   if(textRuns.length > 0) textRuns[textRuns.length-1].text += ' ';\n                   textRuns.push({{text: '', items: []}});\n                }}\n                let text_to_add = item.str;\n                if(item.str.trim().length > 0 && !textRuns[textRuns.length-1].text.endsWith(' ')) text_to_add = ' ' + text_to_add;\n                textRuns[textRuns.length-1].text += text_to_add;\n                textRuns[textRuns.length-1].items.push(item);\n                lastY = item.transform[5];\n            }});\n\n            textRuns.forEach(run => {{\n                let parts = run.text.split(sentenceEnds);\n                let currentItemIndex = 0;\n                parts.forEach((part, index) => {{\n                    if (!part.trim()) return;\n\n                    currentSentence += part.trim();\n                    \n                    let isEndOfSentence = sentenceEnds.test(run.text.substring(currentSentence.length-2, currentSentence.length+2));\n                    let isLastPart = index === parts.length - 1;\n                    \n                    if (isEndOfSentence || isLastPart) {{\n                        if (currentSentence.trim()) {{\n                            sentences.push([currentSentence.trim(), sentenceIndex]);\n                            sentenceToPageMap[sentenceIndex] = i - 1;\n                            sentenceIndex++;\n                        }}\n                        currentSentence = '';\n                    }}\n                }});\n            }});\n            allText.push(pageText);\n        }}\n        const fullText = allText.join(' ').replace(/\\s+/g, ' ');\n        return [fullText, sentences, sentenceToPageMap];\n    }} catch (error) {{\n        console.error('Error processing PDF:', error);\n        return [null, [], {{}}, error.message || 'An unknown error occurred during PDF processing.'];\n    }}\n}})()",
-            callback=State.on_pdf_processed,
-        )
-
-    @rx.event
-    def on_pdf_processed(self, result: list):
-        """Callback after PDF.js has processed the document."""
-        self.is_processing_pdf = False
-        if not result or len(result) < 3:
-            return rx.toast.error("Failed to process PDF: Invalid data returned.")
-        if len(result) == 4 and result[0] is None:
-            error_message = result[3]
-            return rx.toast.error(f"PDF Error: {error_message}")
-        if result[0] is None:
-            return rx.toast.error("Failed to extract text from PDF.")
-        document_text, sentences, sentence_to_page = (result[0], result[1], result[2])
-        self.document_text = document_text
-        self.sentences = [tuple(s) for s in sentences]
-        self.sentence_to_page = {int(k): v for k, v in sentence_to_page.items()}
-        if not self.document_text.strip():
-            return rx.toast.warning(
-                "Document seems to be empty or contains only images."
-            )
-        return rx.toast.success("Document is ready!")
-
-    def _prepare_ssml(self) -> str:
-        """Wraps sentences in SSML <mark> tags."""
-        ssml_parts = ["<speak>"]
-        for sentence, i in self.sentences:
-            escaped_sentence = (
-                sentence.replace("&", "&amp;")
-                .replace("<", "&lt;")
-                .replace(">", "&gt;")
-                .replace('"', "&quot;")
-                .replace("'", "&apos;")
-            )
-            ssml_parts.append(f'<mark name="s{i}"/>{escaped_sentence} ')
-        ssml_parts.append("</speak>")
-        return "".join(ssml_parts)
-
     @rx.event
     def set_active_tab(self, tab: str):
         self.active_tab = tab
 
     @rx.event
     def set_selected_voice(self, voice_id: str):
+        if not self._is_known_voice(voice_id):
+            return
         self.selected_voice = voice_id
+        self._cancel_audio()
+
+    def _is_known_voice(self, voice_id: str) -> bool:
+        return any(voice["id"] == voice_id for voice in self.voices)
+
+    def _cancel_audio(self):
+        jobs.tts_jobs.cancel(self.router.session.client_token, "audio")
         self._reset_audio_state()
+        self.is_generating_audio = False
 
-    async def _synthesize_speech_api(
-        self, ssml: str, voice_id: str, with_timepoints: bool
-    ) -> httpx.Response:
-        api_key = os.getenv("GOOGLE_CLOUD_API_KEY")
-        if not api_key:
-            raise ValueError("GOOGLE_CLOUD_API_KEY secret not set.")
-        url = (
-            f"https://texttospeech.googleapis.com/v1beta1/text:synthesize?key={api_key}"
-        )
-        headers = {"Content-Type": "application/json"}
-        data = {
-            "input": {"ssml": ssml},
-            "voice": {"languageCode": "en-US", "name": voice_id},
-            "audioConfig": {"audioEncoding": "MP3"},
-        }
-        if with_timepoints:
-            data["enableTimePointing"] = ["SSML_MARK"]
-        async with httpx.AsyncClient() as client:
-            response = await client.post(url, headers=headers, json=data, timeout=120)
-        response.raise_for_status()
-        return response
+    @rx.event
+    def cancel_audio(self):
+        """Stops synthesizing the current audio and drops its queued requests."""
+        self._cancel_audio()
+
+    async def _report_audio_queue_position(self, position: int):
+        async with self:
+            self.audio_queue_position = position
 
     @rx.event(background=True)
     async def generate_audio(self):
+        """Synthesizes the document segment by segment, starting playback after the first."""
         async with self:
-            if not self.document_text:
+            if not self.has_text:
                 yield rx.toast.error("No document text to convert.")
                 return
+            self._reset_audio_state()
             self.is_generating_audio = True
-            self.audio_url = None
-        yield
+            self.audio_session = uuid.uuid4().hex
+            self.audio_streamed = True
+            session = self.audio_session
+        yield rx.call_script(
+            f"window.readifyPlayer.startStream('{session}')",
+            callback=State.on_stream_started,
+        )
+        async for event in self._stream_audio(session):
+            yield event
+
+    @rx.event(background=True)
+    async def continue_audio(self):
+        """Resumes synthesis of a session that stopped while its listener was idle."""
+        async with self:
+            if not self._audio_idle:
+                return
+            self._audio_idle = False
+            session = self.audio_session
+        async for event in self._stream_audio(session):
+            yield event
+
+    async def _stream_audio(self, session: str):
+        """Appends the session's segments to the player, pacing synthesis by the playhead.
+
+        Segments already sent are skipped, so a resumed session picks up where
+        it stopped; they are audio-cache hits, not new synthesis.
+        """
+        async with self:
+            document_id = self.document_id
+            voice_id = self.selected_voice
+            skip = self._segments_sent
+            owner = self.router.session.client_token
+        jobs.set_owner(owner, self._report_audio_queue_position)
         try:
-            ssml_text = self._prepare_ssml()
-            response = await self._synthesize_speech_api(
-                ssml=ssml_text, voice_id=self.selected_voice, with_timepoints=True
-            )
-            response_data = response.json()
-            audio_content = base64.b64decode(response_data["audioContent"])
-            timepoints_data = response_data.get("timepoints", [])
-            upload_dir = rx.get_upload_dir()
-            upload_dir.mkdir(parents=True, exist_ok=True)
-            filename = f"audio_{random.randint(1000, 9999)}.mp3"
-            save_file_path = upload_dir / filename
-            with open(save_file_path, "wb") as out:
-                out.write(audio_content)
+            result = await document_store.get_extraction(document_id)
+            sentences = result["sentences"]
+            if not skip:
+                yield rx.call_script(
+                    f"window.readifyPlayer.loadDocument('{session}', {json.dumps(_highlight_data(result))})"
+                )
+            count = 0
+            async for segment in tts.synthesize_segments(
+                document_id, sentences, voice_id
+            ):
+                count += 1
+                if count <= skip:
+                    continue
+                async with self:
+                    if self.audio_session != session:
+                        return
+                    self._segments_sent = count
+                    started = self.audio_streamed and self.is_generating_audio
+                    if self.audio_streamed:
+                        self.is_generating_audio = False
+                yield rx.call_script(
+                    f"window.readifyPlayer.appendSegment('{session}', '{tts.segment_url(segment['key'])}', {json.dumps(segment['times'])}, {json.dumps(segment['sentences'])})"
+                )
+                if started:
+                    yield State.play_generated_audio
+                if not await self._wait_for_playhead(
+                    session, segment["start"] + segment["duration"]
+                ):
+                    return
             async with self:
-                self.audio_url = filename
-                self.timepoints = timepoints_data
+                streamed = self.audio_streamed
+            if not streamed:
+                # Browsers that cannot stream MP3 play one stitched file instead.
+                filename = await _stitch_audio(
+                    session, document_id, sentences, voice_id, owner
+                )
+            async with self:
+                if self.audio_session != session:
+                    return
+                if not streamed:
+                    self.audio_url = filename
                 self.is_generating_audio = False
+            yield rx.call_script(f"window.readifyPlayer.endStream('{session}')")
             yield rx.toast.success("Audio generated successfully.")
-            yield State.play_generated_audio
+            if not streamed:
+                yield State.play_generated_audio
         except Exception as e:
             logging.exception(f"Error generating audio: {e}")
             async with self:
-                self.is_generating_audio = False
+                if self.audio_session == session:
+                    self.is_generating_audio = False
             yield rx.toast.error(
                 "Failed to generate audio. Check API key and that the API is enabled."
             )
+        except asyncio.CancelledError:
+            # Raised when _cancel_audio drops this session's synthesis jobs;
+            # the session has already been reset, so there is nothing to report.
+            async with self:
+                if self.audio_session == session:
+                    self.is_generating_audio = False
+
+    async def _wait_for_playhead(self, session: str, buffered_until: float) -> bool:
+        """Waits until the playhead is within the look-ahead window of the buffered audio.
+
+        Progress ticks wake the wait once the playhead is close enough, so a
+        paused listener costs nothing but an occasional check. Returns False if
+        the session was replaced, or if the playhead has not moved for
+        tts.IDLE_SECONDS; continue_audio then resumes on the next tick.
+        """
+        event = asyncio.Event()
+        _playhead_waiters[session] = (buffered_until - tts.LOOKAHEAD_SECONDS, event)
+        idle_since = time.monotonic()
+        last_time = None
+        try:
+            while True:
+                event.clear()
+                async with self:
+                    if self.audio_session != session:
+                        return False
+                    current_time = self.current_time
+                    if (
+                        not self.audio_streamed
+                        or buffered_until - current_time < tts.LOOKAHEAD_SECONDS
+                    ):
+                        return True
+                    if current_time != last_time:
+                        last_time = current_time
+                        idle_since = time.monotonic()
+                    elif time.monotonic() - idle_since >= tts.IDLE_SECONDS:
+                        self._audio_idle = True
+                        return False
+                try:
+                    await asyncio.wait_for(event.wait(), PLAYHEAD_POLL_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            _playhead_waiters.pop(session, None)
+
+    @rx.event(background=True)
+    async def download_audio(self):
+        """Downloads the session's audio, stitching it into one file on first request."""
+        async with self:
+            session = self.audio_session
+            if not session or self.is_preparing_download:
+                return
+            filename = self.audio_url
+            document_id = self.document_id
+            voice_id = self.selected_voice
+            owner = self.router.session.client_token
+            if not filename:
+                self.is_preparing_download = True
+        if filename:
+            storage.touch(_audio_artifact(session))
+        else:
+            jobs.set_owner(owner, self._report_audio_queue_position)
+            try:
+                result = await document_store.get_extraction(document_id)
+                filename = await _stitch_audio(
+                    session, document_id, result["sentences"], voice_id, owner
+                )
+            except Exception as e:
+                logging.exception(f"Error preparing audio download: {e}")
+                async with self:
+                    if self.audio_session == session:
+                        self.is_preparing_download = False
+                yield rx.toast.error("Failed to prepare the download.")
+                return
+            async with self:
+                if self.audio_session != session:
+                    return
+                self.audio_url = filename
+                self.is_preparing_download = False
+        yield rx.download(url=rx.get_upload_url(filename), filename="audio.mp3")
+
+    @rx.event
+    def on_segment_error(self):
+        """Reported by the player when a streamed segment fails to load."""
+        return rx.toast.error("Part of the audio could not be loaded.")
+
+    @rx.event
+    def on_stream_started(self, supported: bool):
+        """Falls back to playing the stitched file if the browser cannot stream MP3."""
+        if not supported and self.audio_session:
+            self.audio_streamed = False
 
     @rx.event(background=True)
     async def generate_preview_audio(self, voice_id: str):
         async with self:
-            if self.is_generating_preview:
+            if self.is_generating_preview or not self._is_known_voice(voice_id):
                 return
             self.is_generating_preview = True
             self.preview_voice_id = voice_id
         yield
+        jobs.set_owner(self.router.session.client_token)
         try:
-            preview_text = "<speak>Hello, this is a preview of my voice.</speak>"
-            response = await self._synthesize_speech_api(
-                ssml=preview_text, voice_id=voice_id, with_timepoints=False
-            )
-            response_data = response.json()
-            audio_content = base64.b64decode(response_data["audioContent"])
-            upload_dir = rx.get_upload_dir()
-            upload_dir.mkdir(parents=True, exist_ok=True)
-            filename = f"preview_{random.randint(1000, 9999)}.mp3"
-            save_file_path = upload_dir / filename
-            with open(save_file_path, "wb") as out:
-                out.write(audio_content)
+            preview_url = await tts.get_preview(voice_id)
             async with self:
-                self.preview_audio_url = filename
+                self.preview_audio_url = preview_url
                 self.is_generating_preview = False
             yield rx.call_script(
-                f"var p_audio = document.getElementById('preview-player'); p_audio.src = '/_upload/{filename}'; p_audio.play();"
+                f"var p_audio = document.getElementById('preview-player'); p_audio.src = '{preview_url}'; p_audio.play();"
             )
         except Exception as e:
             logging.exception(f"Error generating preview audio: {e}")
@@ -287,9 +471,9 @@ class State(rx.State):
     def handle_play_click(self):
         if self.is_generating_audio:
             return
-        if self.audio_url:
+        if self.audio_url or self.audio_streamed:
             return State.toggle_play_pause
-        if self.document_text:
+        if self.has_text:
             return State.generate_audio
 
     @rx.event
@@ -301,6 +485,8 @@ class State(rx.State):
 
     @rx.event
     def toggle_play_pause(self):
+        if not self.is_playing and self.audio_session:
+            storage.touch(_audio_artifact(self.audio_session))
         script = rx.call_script(
             f"document.getElementById('audio-player').{('play' if not self.is_playing else 'pause')}()"
         )
@@ -309,63 +495,30 @@ class State(rx.State):
 
     @rx.event
     def on_time_update_callback(self, current_time: float):
+        """Records coarse playback progress; highlighting happens in the browser."""
         if not isinstance(current_time, (int, float)):
             current_time = 0
+        self.current_time = current_time
+        _wake_playhead_waiter(self.audio_session, current_time)
         self.current_time_str = self._format_time(current_time)
         if self.duration > 0:
             self.audio_progress = current_time / self.duration * 100
         else:
             self.audio_progress = 0
-        current_index = -1
-        for i, tp in enumerate(self.timepoints):
-            if tp["time_seconds"] <= current_time:
-                try:
-                    current_index = int(tp["mark_name"].replace("s", ""))
-                except (ValueError, TypeError) as e:
-                    logging.exception(f"Error parsing timepoint mark name: {e}")
-                    continue
-            else:
-                break
-        if current_index != self.current_sentence_index:
-            self.current_sentence_index = current_index
-            if current_index != -1:
-                return self._update_highlight_script(current_index)
-
-    def _update_highlight_script(self, sentence_index: int) -> rx.event.EventSpec:
-        """Returns script to highlight sentence and scroll it into view."""
-        return rx.call_script(
-            f"\n            (async () => {{\n                const sentenceIndex = {sentence_index};\n                const sentenceToPageMap = {json.dumps(self.sentence_to_page)};\n                const pageNum = sentenceToPageMap[sentenceIndex];\n                if (pageNum === undefined) return;\n\n                const sentences = {json.dumps(self.sentences)};\n                const sentenceData = sentences.find(s => s[1] === sentenceIndex);\n                if (!sentenceData) return;\n                const sentenceText = sentenceData[0];\n\n                const url = '/_upload/{self.uploaded_file}';\n                const pdfDoc = await pdfjsLib.getDocument(url).promise;\n                const page = await pdfDoc.getPage(pageNum + 1);\n                const scale = {self.zoom_level} / 100;\n                const viewport = page.getViewport({{ scale }});\n                const textContent = await page.getTextContent();\n\n                const bidiTexts = textContent.items.map(item => item.str);\n                const textAsString = bidiTexts.join('');\n                const sentenceStartIndex = textAsString.indexOf(sentenceText.substring(0, 15));\n                const sentenceEndIndex = sentenceStartIndex + sentenceText.length;\n\n                let charCount = 0;\n                let highlightRects = [];\n                let firstRect = null;\n\n                for (const item of textContent.items) {{\n                    const itemStart = charCount;\n                    const itemEnd = charCount + item.str.length;\n\n                    if (itemEnd > sentenceStartIndex && itemStart < sentenceEndIndex) {{\n                        const [x, y, width, height] = [\n                            item.transform[4],\n                            viewport.height - item.transform[5] - item.height,\n                            item.width,\n                            item.height,\n                        ];\n                        const rect = {{ x, y, width, height }};\n                        highlightRects.push(rect);\n                        if (!firstRect) firstRect = rect;\n                    }}\n                    charCount = itemEnd;\n                }}\n                \n                const highlightLayer = document.getElementById('highlight-layer');\n                const pdfContainer = document.getElementById('pdf-container');\n                const pageCanvas = document.getElementById(`pdf-canvas-${{pageNum}}`);\n                if (!highlightLayer || !pdfContainer || !pageCanvas) return;\n                highlightLayer.innerHTML = ''; // Clear previous highlights\n\n                if (highlightRects.length > 0) {{\n                    highlightLayer.style.left = `${{pageCanvas.offsetLeft}}px`;\n                    highlightLayer.style.top = `${{pageCanvas.offsetTop}}px`;\n                    highlightLayer.style.width = `${{pageCanvas.width}}px`;\n                    highlightLayer.style.height = `${{pageCanvas.height}}px`;\n\n                    highlightRects.forEach(rect => {{\n                        const div = document.createElement('div');\n                        div.style.position = 'absolute';\n                        div.style.backgroundColor = 'rgba(252, 211, 77, 0.4)';\n                        div.style.left = `${{rect.x}}px`;\n                        div.style.top = `${{rect.y}}px`;\n                        div.style.width = `${{rect.width}}px`;\n                        div.style.height = `${{rect.height}}px`;\n                        highlightLayer.appendChild(div);\n                    }});\n                    \n                    if (firstRect) {{\n                         pdfContainer.scrollTo({{\n                             top: pageCanvas.offsetTop + firstRect.y - pdfContainer.clientHeight / 4,\n                             behavior: 'smooth'\n                         }});\n                    }}\n                }}\n            }})();\n            "
-        )
-
-    @rx.event
-    def on_time_update(self) -> rx.event.EventSpec:
-        return rx.call_script(
-            "document.getElementById('audio-player').currentTime",
-            callback=State.on_time_update_callback,
-        )
+        if self._audio_idle:
+            return State.continue_audio
 
     @rx.event
     def on_duration_change_callback(self, duration: float):
-        if not isinstance(duration, (int, float)):
+        if not isinstance(duration, (int, float)) or not math.isfinite(duration):
             duration = 0
         self.duration = duration
         self.duration_str = self._format_time(duration)
 
-    @rx.event
-    def on_duration_change(self) -> rx.event.EventSpec:
-        return rx.call_script(
-            "document.getElementById('audio-player').duration",
-            callback=State.on_duration_change_callback,
-        )
-
     @rx.event
     def on_ended(self):
         self.is_playing = False
         self.audio_progress = 100
-        self.current_sentence_index = -1
-        return rx.call_script(
-            "var hl = document.getElementById('highlight-layer'); if(hl) hl.innerHTML = '';"
-        )
 
     @rx.event
     def on_slider_change(self, value: int):
@@ -381,7 +534,11 @@ class State(rx.State):
         )
 
     def _format_time(self, seconds: float) -> str:
-        if not isinstance(seconds, (int, float)) or seconds < 0:
+        if (
+            not isinstance(seconds, (int, float))
+            or not math.isfinite(seconds)
+            or seconds < 0
+        ):
             return "00:00"
         minutes = int(seconds // 60)
         seconds = int(seconds % 60)
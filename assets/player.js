@@ -0,0 +1,206 @@
+// Progressive playback and sentence highlighting for the reader's audio player.
+//
+// The server synthesizes a document in segments and announces each one with
+// appendSegment(); when the browser supports MP3 in Media Source Extensions the
+// segments are fed into a single MediaSource so playback can start after the
+// first one. Otherwise the server falls back to the stitched file.
+//
+// The sentence table (page and line boxes per sentence) is shipped once per
+// audio session with loadDocument() and each segment carries its own
+// timepoints, so the highlighted sentence is tracked here on every timeupdate
+// instead of round-tripping to the server.
+window.readifyPlayer = (() => {
+  let session = null;
+  let documentData = null;
+  let times = [];
+  let sentenceIndices = [];
+  let currentSentence = -1;
+  let mediaSource = null;
+  let sourceBuffer = null;
+  let queue = [];
+  let ended = false;
+  let fetches = Promise.resolve();
+
+  const isSupported = () =>
+    typeof MediaSource !== "undefined" && MediaSource.isTypeSupported("audio/mpeg");
+
+  const waitForPlayer = async (id) => {
+    for (let attempt = 0; attempt < 100; attempt++) {
+      const audio = document.getElementById("audio-player");
+      if (audio && audio.dataset.session === id) return audio;
+      await new Promise((resolve) => setTimeout(resolve, 50));
+    }
+    return null;
+  };
+
+  const pump = () => {
+    if (!sourceBuffer || sourceBuffer.updating) return;
+    if (queue.length > 0) {
+      sourceBuffer.appendBuffer(queue.shift());
+    } else if (ended && mediaSource.readyState === "open") {
+      mediaSource.endOfStream();
+    }
+  };
+
+  // The player bar's hidden button forwards load failures to the server.
+  const reportSegmentError = () => {
+    const button = document.getElementById("audio-segment-error");
+    if (button) button.click();
+  };
+
+  const formatTime = (seconds) => {
+    if (!isFinite(seconds) || seconds < 0) return "00:00";
+    const minutes = String(Math.floor(seconds / 60)).padStart(2, "0");
+    return `${minutes}:${String(Math.floor(seconds % 60)).padStart(2, "0")}`;
+  };
+
+  // Index of the last timepoint at or before `time`, or -1.
+  const findTimepoint = (time) => {
+    let low = 0;
+    let high = times.length - 1;
+    let found = -1;
+    while (low <= high) {
+      const mid = (low + high) >> 1;
+      if (times[mid] <= time) {
+        found = mid;
+        low = mid + 1;
+      } else {
+        high = mid - 1;
+      }
+    }
+    return found;
+  };
+
+  const clearHighlight = () => {
+    const highlightLayer = document.getElementById("highlight-layer");
+    if (highlightLayer) highlightLayer.innerHTML = "";
+  };
+
+  // Sentence boxes are precomputed on the server in units of 1/RECT_PRECISION
+  // of the page, so highlighting is a lookup scaled to the page's laid-out size.
+  const RECT_PRECISION = 10000;
+
+  const highlight = (sentenceIndex) => {
+    const pageNum = documentData.pages[sentenceIndex];
+    const rects = documentData.rects[sentenceIndex];
+    const pageCanvas = document.getElementById(`pdf-canvas-${pageNum}`);
+    const highlightLayer = document.getElementById("highlight-layer");
+    const pdfContainer = document.getElementById("pdf-container");
+    if (!rects || !pageCanvas || !highlightLayer || !pdfContainer) return;
+    highlightLayer.innerHTML = "";
+    if (rects.length === 0) return;
+    const width = pageCanvas.offsetWidth / RECT_PRECISION;
+    const height = pageCanvas.offsetHeight / RECT_PRECISION;
+    const pageWrapper = pageCanvas.parentElement;
+    const pageTop = pageWrapper.offsetTop + pageCanvas.offsetTop;
+    highlightLayer.style.left = `${pageWrapper.offsetLeft + pageCanvas.offsetLeft}px`;
+    highlightLayer.style.top = `${pageTop}px`;
+    highlightLayer.style.width = `${pageCanvas.offsetWidth}px`;
+    highlightLayer.style.height = `${pageCanvas.offsetHeight}px`;
+    for (let i = 0; i < rects.length; i += 4) {
+      const div = document.createElement("div");
+      div.style.position = "absolute";
+      div.style.backgroundColor = "rgba(252, 211, 77, 0.4)";
+      div.style.left = `${rects[i] * width}px`;
+      div.style.top = `${rects[i + 1] * height}px`;
+      div.style.width = `${(rects[i + 2] - rects[i]) * width}px`;
+      div.style.height = `${(rects[i + 3] - rects[i + 1]) * height}px`;
+      highlightLayer.appendChild(div);
+    }
+    pdfContainer.scrollTo({
+      top: pageTop + rects[1] * height - pdfContainer.clientHeight / 4,
+      behavior: "smooth",
+    });
+  };
+
+  const onTimeUpdate = (event) => {
+    const audio = event.target;
+    if (!audio || audio.id !== "audio-player" || audio.dataset.session !== session) return;
+    const currentTime = document.getElementById("audio-current-time");
+    if (currentTime) currentTime.textContent = formatTime(audio.currentTime);
+    const slider = document.getElementById("audio-slider");
+    if (slider && isFinite(audio.duration) && audio.duration > 0) {
+      slider.value = (audio.currentTime / audio.duration) * 100;
+    }
+    if (!documentData) return;
+    const timepoint = findTimepoint(audio.currentTime);
+    const sentenceIndex = timepoint === -1 ? -1 : sentenceIndices[timepoint];
+    if (sentenceIndex === currentSentence) return;
+    currentSentence = sentenceIndex;
+    if (sentenceIndex === -1) {
+      clearHighlight();
+    } else {
+      highlight(sentenceIndex);
+    }
+  };
+
+  // Media events do not bubble, so listen in the capture phase.
+  document.addEventListener("timeupdate", onTimeUpdate, true);
+  document.addEventListener("ended", clearHighlight, true);
+
+  return {
+    loadDocument(id, data) {
+      if (session !== id) return;
+      documentData = data;
+    },
+
+    async startStream(id) {
+      session = id;
+      documentData = null;
+      times = [];
+      sentenceIndices = [];
+      currentSentence = -1;
+      clearHighlight();
+      mediaSource = null;
+      sourceBuffer = null;
+      queue = [];
+      ended = false;
+      fetches = Promise.resolve();
+      if (!isSupported()) return false;
+      const audio = await waitForPlayer(id);
+      if (!audio || session !== id) return false;
+      const source = new MediaSource();
+      mediaSource = source;
+      audio.src = URL.createObjectURL(source);
+      await new Promise((resolve) =>
+        source.addEventListener("sourceopen", resolve, { once: true })
+      );
+      if (session !== id) return false;
+      sourceBuffer = source.addSourceBuffer("audio/mpeg");
+      sourceBuffer.mode = "sequence";
+      sourceBuffer.addEventListener("updateend", pump);
+      pump();
+      return true;
+    },
+
+    // A segment that fails to load is skipped and reported, rather than
+    // rejecting the chain, so later segments and endStream() still go through.
+    appendSegment(id, url, segmentTimes, segmentSentences) {
+      if (session !== id) return;
+      times.push(...segmentTimes);
+      sentenceIndices.push(...segmentSentences);
+      if (!isSupported()) return;
+      fetches = fetches.then(async () => {
+        try {
+          const response = await fetch(url);
+          if (!response.ok) throw new Error(`HTTP ${response.status}`);
+          const data = await response.arrayBuffer();
+          if (session !== id) return;
+          queue.push(data);
+          pump();
+        } catch (error) {
+          console.error(`Failed to load audio segment ${url}`, error);
+          if (session === id) reportSegmentError();
+        }
+      });
+    },
+
+    endStream(id) {
+      if (session !== id) return;
+      fetches = fetches.then(() => {
+        ended = true;
+        pump();
+      });
+    },
+  };
+})();
@@ -0,0 +1,251 @@
+// Shared PDF.js access for the reader.
+//
+// Loading a document is the expensive PDF.js call, so the loaded document
+// proxy and its page proxies are cached here and reused by the reader.
+window.readifyPdf = (() => {
+  let documentUrl = null;
+  let documentPromise = null;
+  let pages = new Map();
+
+  const getDocument = (url) => {
+    if (url !== documentUrl) {
+      if (documentPromise) {
+        documentPromise.then((pdfDoc) => pdfDoc.destroy()).catch(() => {});
+      }
+      documentUrl = url;
+      documentPromise = pdfjsLib.getDocument(url).promise;
+      pages = new Map();
+    }
+    return documentPromise;
+  };
+
+  // Pages are numbered from 0, like the pdf-canvas-* elements.
+  const getPage = (url, pageNum) => {
+    getDocument(url);
+    if (!pages.has(pageNum)) {
+      pages.set(pageNum, documentPromise.then((pdfDoc) => pdfDoc.getPage(pageNum + 1)));
+    }
+    return pages.get(pageNum);
+  };
+
+  return { getDocument, getPage };
+})();
+
+// Virtualized page rendering for the reader.
+//
+// Every page gets a placeholder sized from the page dimensions extracted on the
+// server, so the scroll height is right without touching PDF.js. Only pages in
+// or near the viewport are rasterized; their canvases are released again when
+// they scroll away. Rendered pages are kept as ImageBitmaps in a small LRU per
+// zoom level, so scrolling back or returning to a zoom level is a blit rather
+// than a re-render. Zoom changes are debounced and only re-render what is
+// visible.
+//
+// With `tiles` set, pages are not parsed in the browser at all: each page is
+// fetched as an image the server rendered (and cached) for the nearest zoom
+// bucket at or above the current zoom.
+window.readifyReader = (() => {
+  const ROOT_MARGIN = "100% 0px";
+  const MAX_BITMAPS = 24;
+  const ZOOM_DEBOUNCE_MS = 250;
+
+  let url = null;
+  let pageSizes = [];
+  let tiles = null;
+  let zoom = 100;
+  let generation = 0;
+  let observer = null;
+  let zoomTimer = null;
+  let visible = new Set();
+  let renderTasks = new Map();
+  let bitmaps = new Map();
+
+  const scale = () => zoom / 100;
+
+  const getContainer = () => document.getElementById("pdf-container");
+
+  const getWrapper = (pageNum) => {
+    const container = getContainer();
+    return container && container.querySelector(`[data-page="${pageNum}"]`);
+  };
+
+  const waitForPages = async (count) => {
+    for (let attempt = 0; attempt < 100; attempt++) {
+      const container = getContainer();
+      if (container && container.querySelectorAll("[data-page]").length >= count) {
+        return container;
+      }
+      await new Promise((resolve) => setTimeout(resolve, 50));
+    }
+    return null;
+  };
+
+  const rememberBitmap = (key, bitmap) => {
+    bitmaps.delete(key);
+    bitmaps.set(key, bitmap);
+    while (bitmaps.size > MAX_BITMAPS) {
+      const [oldestKey, oldest] = bitmaps.entries().next().value;
+      bitmaps.delete(oldestKey);
+      oldest.close();
+    }
+  };
+
+  const takeBitmap = (key) => {
+    const bitmap = bitmaps.get(key);
+    if (bitmap) {
+      bitmaps.delete(key);
+      bitmaps.set(key, bitmap);
+    }
+    return bitmap;
+  };
+
+  const cancelRender = (pageNum) => {
+    const task = renderTasks.get(pageNum);
+    if (task) {
+      task.cancel();
+      renderTasks.delete(pageNum);
+    }
+  };
+
+  const releaseCanvas = (pageNum) => {
+    cancelRender(pageNum);
+    const canvas = document.getElementById(`pdf-canvas-${pageNum}`);
+    if (canvas && canvas.width) {
+      canvas.width = 0;
+      canvas.height = 0;
+      delete canvas.dataset.zoom;
+    }
+  };
+
+  const draw = (pageNum, bitmap) => {
+    const canvas = document.getElementById(`pdf-canvas-${pageNum}`);
+    if (!canvas) return;
+    canvas.width = bitmap.width;
+    canvas.height = bitmap.height;
+    canvas.getContext("2d").drawImage(bitmap, 0, 0);
+    canvas.dataset.zoom = String(zoom);
+  };
+
+  const tileBucket = () =>
+    tiles.buckets.find((bucket) => bucket >= zoom) || tiles.buckets[tiles.buckets.length - 1];
+
+  const fetchTile = async (pageNum) => {
+    const image = new Image();
+    image.src = `${tiles.base}/${pageNum}/${tileBucket()}`;
+    await image.decode();
+    return createImageBitmap(image);
+  };
+
+  const rasterize = async (pageNum) => {
+    if (tiles) return fetchTile(pageNum);
+    const page = await window.readifyPdf.getPage(url, pageNum);
+    const viewport = page.getViewport({ scale: scale() * (window.devicePixelRatio || 1) });
+    const scratch = document.createElement("canvas");
+    scratch.width = Math.ceil(viewport.width);
+    scratch.height = Math.ceil(viewport.height);
+    const task = page.render({ canvasContext: scratch.getContext("2d"), viewport });
+    renderTasks.set(pageNum, task);
+    try {
+      await task.promise;
+    } finally {
+      if (renderTasks.get(pageNum) === task) renderTasks.delete(pageNum);
+    }
+    const bitmap = await createImageBitmap(scratch);
+    scratch.width = 0;
+    scratch.height = 0;
+    return bitmap;
+  };
+
+  const renderPage = async (pageNum) => {
+    const canvas = document.getElementById(`pdf-canvas-${pageNum}`);
+    if (!canvas || canvas.dataset.zoom === String(zoom) || renderTasks.has(pageNum)) return;
+    const key = `${zoom}:${pageNum}`;
+    const cached = takeBitmap(key);
+    if (cached) {
+      draw(pageNum, cached);
+      return;
+    }
+    const current = generation;
+    try {
+      const bitmap = await rasterize(pageNum);
+      if (current !== generation) {
+        bitmap.close();
+        return;
+      }
+      rememberBitmap(key, bitmap);
+      if (visible.has(pageNum)) draw(pageNum, bitmap);
+    } catch (error) {
+      if (error && error.name === "RenderingCancelledException") return;
+      console.error(`Error rendering page ${pageNum + 1}:`, error);
+    }
+  };
+
+  const layout = () => {
+    const s = scale();
+    pageSizes.forEach(([width, height], pageNum) => {
+      const wrapper = getWrapper(pageNum);
+      if (!wrapper) return;
+      wrapper.style.width = `${width * s}px`;
+      wrapper.style.height = `${height * s}px`;
+    });
+  };
+
+  const onIntersect = (entries) => {
+    for (const entry of entries) {
+      const pageNum = Number(entry.target.dataset.page);
+      if (entry.isIntersecting) {
+        visible.add(pageNum);
+        renderPage(pageNum);
+      } else {
+        visible.delete(pageNum);
+        releaseCanvas(pageNum);
+      }
+    }
+  };
+
+  const reset = () => {
+    generation++;
+    if (observer) observer.disconnect();
+    observer = null;
+    clearTimeout(zoomTimer);
+    for (const pageNum of renderTasks.keys()) cancelRender(pageNum);
+    for (const bitmap of bitmaps.values()) bitmap.close();
+    bitmaps = new Map();
+    visible = new Set();
+  };
+
+  const applyZoom = (newZoom) => {
+    const container = getContainer();
+    if (!container || newZoom === zoom) return;
+    const position = container.scrollHeight ? container.scrollTop / container.scrollHeight : 0;
+    generation++;
+    for (const pageNum of renderTasks.keys()) cancelRender(pageNum);
+    zoom = newZoom;
+    layout();
+    container.scrollTop = position * container.scrollHeight;
+    for (const pageNum of visible) renderPage(pageNum);
+  };
+
+  return {
+    async open(documentUrl, sizes, initialZoom, tileOptions = null) {
+      reset();
+      const current = generation;
+      url = documentUrl;
+      pageSizes = sizes;
+      zoom = initialZoom;
+      tiles = tileOptions;
+      const container = await waitForPages(sizes.length);
+      if (!container || current !== generation) return;
+      if (!tiles) window.readifyPdf.getDocument(url);
+      for (let pageNum = 0; pageNum < sizes.length; pageNum++) releaseCanvas(pageNum);
+      layout();
+      observer = new IntersectionObserver(onIntersect, { root: container, rootMargin: ROOT_MARGIN });
+      container.querySelectorAll("[data-page]").forEach((wrapper) => observer.observe(wrapper));
+    },
+
+    setZoom(newZoom) {
+      clearTimeout(zoomTimer);
+      zoomTimer = setTimeout(() => applyZoom(newZoom), ZOOM_DEBOUNCE_MS);
+    },
+  };
+})();
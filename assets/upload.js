@@ -0,0 +1,95 @@
+// PDF uploads straight to the document store.
+//
+// The file is sent as the raw request body to the upload route, which hashes
+// and writes it to disk as it arrives, so neither side buffers the whole file.
+// Progress comes from the bytes the browser has actually sent and is drawn
+// directly into the progress bar. The outcome is handed to the server by
+// clicking a hidden button whose handler collects it with takeResult(), which
+// keeps the long-running upload out of Reflex's event queue.
+window.readifyUpload = (() => {
+  let request = null;
+  let result = null;
+
+  const setProgress = (fraction) => {
+    const bar = document.getElementById("upload-progress");
+    if (bar) bar.value = Math.round(fraction * 100);
+  };
+
+  // Deferred so the input's own change event reaches the server first.
+  const finish = (outcome) => {
+    request = null;
+    result = outcome;
+    const input = document.getElementById("pdf-file-input");
+    if (input) input.value = "";
+    setTimeout(() => {
+      const done = document.getElementById("pdf-upload-done");
+      if (done) done.click();
+    }, 0);
+  };
+
+  const send = (input) => {
+    const file = input.files && input.files[0];
+    if (!file) return;
+    const maxBytes = Number(input.dataset.maxBytes);
+    if (maxBytes && file.size > maxBytes) {
+      finish({ error: `The file is larger than ${Math.floor(maxBytes / (1024 * 1024))} MB.` });
+      return;
+    }
+    const xhr = new XMLHttpRequest();
+    request = xhr;
+    xhr.open("POST", input.dataset.uploadUrl);
+    xhr.setRequestHeader("Content-Type", "application/pdf");
+    xhr.upload.addEventListener("progress", (event) => {
+      if (event.lengthComputable) setProgress(event.loaded / event.total);
+    });
+    xhr.addEventListener("load", () => {
+      let body = {};
+      try {
+        body = JSON.parse(xhr.responseText);
+      } catch (error) {}
+      if (xhr.status === 200 && body.document_id) {
+        finish({ document_id: body.document_id, filename: file.name });
+      } else {
+        finish({ error: body.error || "Upload failed." });
+      }
+    });
+    xhr.addEventListener("error", () => finish({ error: "Upload failed." }));
+    xhr.addEventListener("abort", () => finish({ cancelled: true }));
+    xhr.send(file);
+  };
+
+  document.addEventListener(
+    "change",
+    (event) => {
+      if (event.target.id === "pdf-file-input" && !request) send(event.target);
+    },
+    true
+  );
+
+  const dropZone = (event) => event.target.closest && event.target.closest("#pdf-upload");
+
+  document.addEventListener("dragover", (event) => {
+    if (dropZone(event)) event.preventDefault();
+  });
+
+  document.addEventListener("drop", (event) => {
+    if (!dropZone(event)) return;
+    event.preventDefault();
+    const input = document.getElementById("pdf-file-input");
+    if (!input || request || event.dataTransfer.files.length === 0) return;
+    input.files = event.dataTransfer.files;
+    input.dispatchEvent(new Event("change", { bubbles: true }));
+  });
+
+  return {
+    cancel() {
+      if (request) request.abort();
+    },
+
+    takeResult() {
+      const outcome = result;
+      result = null;
+      return outcome;
+    },
+  };
+})();
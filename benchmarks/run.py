@@ -0,0 +1,241 @@
+"""Micro-benchmarks for the document and playback hot paths.
+
+Run from the repository root, with the app's requirements installed:
+
+    python -m benchmarks.run --pages 10 100 1000 --output results.json
+
+Results are written as JSON (to stdout without --output), one record per
+benchmark and document size, so runs from different releases can be diffed.
+"""
+
+import argparse
+import asyncio
+import datetime
+import json
+import logging
+import platform
+import random
+import statistics
+import subprocess
+import tempfile
+import time
+from pathlib import Path
+
+import reflex as rx
+from reflex.utils.format import json_dumps
+
+from app.services import tts
+from app.services.pdf_extraction import ExtractionResult, extract_document
+from app.states.ai_state import AIState
+from app.states.state import State, _highlight_data
+from benchmarks.synthetic import make_pdf, sentence
+
+# Seconds of audio per sentence when faking playback of a document.
+SECONDS_PER_SENTENCE = 4.0
+TICKS = 2000
+JSON_ITEMS = (100, 1000, 10000)
+CHAT_TURNS = 40
+
+
+def _timed(func, repeat: int) -> dict:
+    """Runs `func` `repeat` times and returns its best and median wall time in ms."""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000)
+    return {
+        "best_ms": round(min(samples), 3),
+        "median_ms": round(statistics.median(samples), 3),
+    }
+
+
+def _states() -> tuple[State, AIState]:
+    root = rx.State(_reflex_internal_init=True)
+    return (
+        root.get_substate(State.get_full_name().split(".")[1:]),
+        root.get_substate(AIState.get_full_name().split(".")[1:]),
+    )
+
+
+def bench_extraction(path: Path, repeat: int) -> tuple[dict, ExtractionResult]:
+    result = asyncio.run(extract_document(path))
+    timing = _timed(lambda: asyncio.run(extract_document(path)), repeat)
+    return {
+        **timing,
+        "file_bytes": path.stat().st_size,
+        "sentences": len(result["sentences"]),
+        "pages_per_second": round(result["page_count"] / timing["best_ms"] * 1000, 1),
+    }, result
+
+
+def bench_ssml(result: ExtractionResult, repeat: int) -> dict:
+    sentences = result["sentences"]
+    batches = tts.batch_ssml(sentences)
+    ssml_bytes = sum(len(batch["ssml"].encode()) for batch in batches)
+    timing = _timed(lambda: tts.batch_ssml(sentences), repeat)
+    return {
+        **timing,
+        "batches": len(batches),
+        "ssml_bytes": ssml_bytes,
+        "sentences_per_second": round(len(sentences) / timing["best_ms"] * 1000),
+        "prepare_ssml": _timed(lambda: tts.prepare_ssml(sentences), repeat),
+    }
+
+
+def bench_time_update(result: ExtractionResult) -> dict:
+    """Per-tick cost of playback progress: the handler and the delta sent back."""
+    state, _ = _states()
+    root = state.parent_state
+    state.duration = len(result["sentences"]) * SECONDS_PER_SENTENCE
+    root._clean()
+    ticks = [state.duration * n / TICKS for n in range(TICKS)]
+    handler_ms = 0.0
+    delta_ms = 0.0
+    delta_bytes = 0
+    for current_time in ticks:
+        start = time.perf_counter()
+        State.on_time_update_callback.fn(state, current_time)
+        handler_ms += (time.perf_counter() - start) * 1000
+        start = time.perf_counter()
+        delta = json_dumps(root.get_delta())
+        root._clean()
+        delta_ms += (time.perf_counter() - start) * 1000
+        delta_bytes += len(delta.encode())
+    return {
+        "ticks": TICKS,
+        "handler_us_per_tick": round(handler_ms / TICKS * 1000, 2),
+        "delta_us_per_tick": round(delta_ms / TICKS * 1000, 2),
+        "delta_bytes_per_tick": round(delta_bytes / TICKS, 1),
+    }
+
+
+def bench_highlight(result: ExtractionResult, repeat: int) -> dict:
+    payload = json.dumps(_highlight_data(result))
+    return {
+        **_timed(lambda: json.dumps(_highlight_data(result)), repeat),
+        "payload_bytes": len(payload.encode()),
+    }
+
+
+def bench_state_size(result: ExtractionResult) -> dict:
+    """Sizes of the states with a loaded document, audio and a used set of AI tools."""
+    rng = random.Random(0)
+    state, ai_state = _states()
+    state.document_id = "0" * 64
+    state.pdf_page_count = result["page_count"]
+    ai_state.summary = "\n".join(f"- {sentence(rng)}" for _ in range(5))
+    ai_state.glossary = [
+        {"term": f"term {n}", "definition": sentence(rng)} for n in range(60)
+    ]
+    ai_state.quiz = [
+        {
+            "question": sentence(rng),
+            "options": [sentence(rng) for _ in range(4)],
+            "correct_answer": 0,
+            "explanation": sentence(rng),
+            "user_answer": None,
+            "is_correct": None,
+        }
+        for _ in range(10)
+    ]
+    ai_state.chat_history = [
+        {
+            "role": role,
+            "text": " ".join(sentence(rng) for _ in range(2 if role == "user" else 8)),
+        }
+        for _ in range(CHAT_TURNS)
+        for role in ("user", "model")
+    ]
+    return {
+        "state_pickle_bytes": len(state._serialize()),
+        "state_json_bytes": len(json_dumps(state.dict()).encode()),
+        "ai_state_pickle_bytes": len(ai_state._serialize()),
+        "ai_state_json_bytes": len(json_dumps(ai_state.dict()).encode()),
+    }
+
+
+def bench_json_parse(items: int, repeat: int) -> dict:
+    """`_safe_json_parse` on a glossary-shaped model reply in a markdown code block."""
+    rng = random.Random(items)
+    glossary = [
+        {"term": f"term {n}", "definition": sentence(rng)} for n in range(items)
+    ]
+    reply = "```json\n" + json.dumps(glossary, indent=2) + "\n```"
+    _, ai_state = _states()
+    logging.disable(logging.CRITICAL)
+    try:
+        parsed = ai_state._safe_json_parse(reply, [])
+        timing = _timed(lambda: ai_state._safe_json_parse(reply, []), repeat)
+    finally:
+        logging.disable(logging.NOTSET)
+    # A parser that fails returns the default quickly, which would pass for a fast one.
+    assert parsed == glossary, "_safe_json_parse did not parse the reply"
+    return {
+        **timing,
+        "reply_bytes": len(reply.encode()),
+        "parsed_items": len(parsed),
+    }
+
+
+def _git_revision() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def run(pages: list[int], repeat: int) -> dict:
+    records = []
+    with tempfile.TemporaryDirectory() as directory:
+        for count in pages:
+            path = Path(directory) / f"synthetic-{count}.pdf"
+            make_pdf(path, count)
+            # Large documents are timed fewer times to keep a run short.
+            times = max(1, repeat if count <= 100 else repeat // 3)
+            extraction, result = bench_extraction(path, times)
+            for name, metrics in (
+                ("extraction", extraction),
+                ("ssml", bench_ssml(result, repeat)),
+                ("time_update", bench_time_update(result)),
+                ("highlight_payload", bench_highlight(result, repeat)),
+                ("state_size", bench_state_size(result)),
+            ):
+                records.append({"name": name, "pages": count, **metrics})
+    for items in JSON_ITEMS:
+        records.append(
+            {
+                "name": "safe_json_parse",
+                "items": items,
+                **bench_json_parse(items, repeat),
+            }
+        )
+    return {
+        "revision": _git_revision(),
+        "created_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": records,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pages", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", type=Path)
+    args = parser.parse_args()
+    report = json.dumps(run(args.pages, args.repeat), indent=2)
+    if args.output:
+        args.output.write_text(report + "\n")
+    else:
+        print(report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+import random
+from pathlib import Path
+
+import pymupdf
+
+WORDS = (
+    "reader document page sentence model audio voice section summary chapter "
+    "figure table result method analysis system network signal energy market "
+    "theory process value protocol review measure sample study example "
+    "the of and to in is that for on with as by at from this which are be was"
+).split()
+PAGE_RECT = pymupdf.paper_rect("letter")
+MARGIN = 54
+FONT_SIZE = 10
+
+
+def sentence(rng: random.Random) -> str:
+    words = rng.choices(WORDS, k=rng.randint(6, 22))
+    text = " ".join(words)
+    return text[0].upper() + text[1:] + rng.choice([".", ".", ".", "?", "!"])
+
+
+def page_text(rng: random.Random, sentences: int) -> str:
+    paragraphs = []
+    while sentences > 0:
+        count = min(sentences, rng.randint(3, 7))
+        paragraphs.append(" ".join(sentence(rng) for _ in range(count)))
+        sentences -= count
+    return "\n\n".join(paragraphs)
+
+
+def make_pdf(path: Path, pages: int, sentences_per_page: int = 24, seed: int = 0):
+    """Writes a text-only PDF of `pages` letter pages filled with random prose."""
+    rng = random.Random(seed)
+    document = pymupdf.open()
+    box = pymupdf.Rect(
+        MARGIN, MARGIN, PAGE_RECT.width - MARGIN, PAGE_RECT.height - MARGIN
+    )
+    for _ in range(pages):
+        page = document.new_page(width=PAGE_RECT.width, height=PAGE_RECT.height)
+        page.insert_textbox(box, page_text(rng, sentences_per_page), fontsize=FONT_SIZE)
+    document.save(path, garbage=4, deflate=True)
+    document.close()
@@ -0,0 +1,158 @@
+import asyncio
+
+import pytest
+
+from app.services import jobs
+
+
+async def _hold(scheduler, session, priority, name, started, hold=0.02, tag=""):
+    jobs.set_owner(session)
+    async with scheduler.slot(priority, tag):
+        started.append(name)
+        await asyncio.sleep(hold)
+
+
+def test_limits_running_jobs_globally_and_per_session():
+    async def main():
+        scheduler = jobs.JobScheduler("test", max_running=3, max_per_session=2)
+        peak = {"total": 0, "a": 0}
+        running = {"total": 0, "a": 0}
+
+        async def job(session):
+            jobs.set_owner(session)
+            async with scheduler.slot():
+                running["total"] += 1
+                running[session] = running.get(session, 0) + 1
+                peak["total"] = max(peak["total"], running["total"])
+                peak["a"] = max(peak["a"], running.get("a", 0))
+                await asyncio.sleep(0.01)
+                running["total"] -= 1
+                running[session] -= 1
+
+        await asyncio.gather(
+            *(job("a") for _ in range(6)), *(job(f"s{n}") for n in range(4))
+        )
+        assert peak == {"total": 3, "a": 2}
+        assert scheduler.queue_depth == 0
+
+    asyncio.run(main())
+
+
+def test_admits_interactive_jobs_before_bulk_ones():
+    async def main():
+        scheduler = jobs.JobScheduler("test", max_running=1, max_per_session=1)
+        started = []
+        tasks = [
+            asyncio.create_task(
+                _hold(scheduler, f"bulk{n}", jobs.PRIORITY_BULK, f"bulk{n}", started)
+            )
+            for n in range(3)
+        ]
+        await asyncio.sleep(0)
+        tasks.append(
+            asyncio.create_task(
+                _hold(scheduler, "chat", jobs.PRIORITY_INTERACTIVE, "chat", started)
+            )
+        )
+        await asyncio.gather(*tasks)
+        assert started == ["bulk0", "chat", "bulk1", "bulk2"]
+
+    asyncio.run(main())
+
+
+def test_session_at_its_limit_does_not_block_others():
+    async def main():
+        scheduler = jobs.JobScheduler("test", max_running=2, max_per_session=1)
+        started = []
+        tasks = [
+            asyncio.create_task(
+                _hold(scheduler, "a", jobs.PRIORITY_BULK, f"a{n}", started)
+            )
+            for n in range(3)
+        ]
+        await asyncio.sleep(0)
+        tasks.append(
+            asyncio.create_task(
+                _hold(scheduler, "b", jobs.PRIORITY_BULK, "b0", started)
+            )
+        )
+        await asyncio.gather(*tasks)
+        assert started.index("b0") == 1
+
+    asyncio.run(main())
+
+
+def test_cancel_drops_queued_and_running_jobs_with_tag():
+    async def main():
+        scheduler = jobs.JobScheduler("test", max_running=1, max_per_session=1)
+        started = []
+        audio = [
+            asyncio.create_task(
+                _hold(scheduler, "a", 1, f"audio{n}", started, 1, "audio")
+            )
+            for n in range(3)
+        ]
+        other = asyncio.create_task(
+            _hold(scheduler, "a", 1, "other", started, 0.01, "other")
+        )
+        await asyncio.sleep(0.01)
+        assert scheduler.cancel("a", "audio") == 3
+        results = await asyncio.gather(*audio, return_exceptions=True)
+        assert all(isinstance(r, asyncio.CancelledError) for r in results)
+        await other
+        assert started == ["audio0", "other"]
+        assert scheduler.queue_depth == 0
+        assert scheduler._running_total == 0
+
+    asyncio.run(main())
+
+
+def test_reports_positions_coalesced(monkeypatch):
+    monkeypatch.setattr(jobs, "POSITION_REPORT_SECONDS", 0.05)
+
+    async def main():
+        scheduler = jobs.JobScheduler("test", max_running=1, max_per_session=50)
+        reports = []
+
+        async def report(position):
+            reports.append(position)
+
+        async def job(owner_report, hold):
+            jobs.set_owner("a" if owner_report else "x", owner_report)
+            async with scheduler.slot():
+                await asyncio.sleep(hold)
+
+        blocker = asyncio.create_task(job(None, 0.12))
+        await asyncio.sleep(0)
+        # A burst drains within one interval once the blocker is done.
+        burst = [asyncio.create_task(job(report, 0)) for _ in range(20)]
+        await asyncio.gather(blocker, *burst)
+        await asyncio.sleep(0.1)
+        assert reports == [1, 0]
+
+    asyncio.run(main())
+
+
+@pytest.mark.parametrize("shared", [False, True])
+def test_shared_work_counts_against_starting_session(shared):
+    async def main():
+        scheduler = jobs.JobScheduler("test", max_running=8, max_per_session=1)
+        running = 0
+        peak = 0
+
+        async def work():
+            nonlocal running, peak
+            async with scheduler.slot():
+                running += 1
+                peak = max(peak, running)
+                await asyncio.sleep(0.01)
+                running -= 1
+
+        jobs.set_owner("a")
+        context = jobs.shared_context() if shared else None
+        await asyncio.gather(
+            *(asyncio.create_task(work(), context=context) for _ in range(4))
+        )
+        assert peak == 1
+
+    asyncio.run(main())
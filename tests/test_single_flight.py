@@ -0,0 +1,160 @@
+import asyncio
+
+from app.services import jobs
+from app.services.single_flight import SingleFlight
+
+
+def _flight(max_running=8, max_per_session=1):
+    scheduler = jobs.JobScheduler("test", max_running, max_per_session)
+    return scheduler, SingleFlight(scheduler)
+
+
+def test_run_shares_one_call_between_concurrent_callers():
+    async def main():
+        scheduler, flight = _flight()
+        calls = 0
+
+        async def call():
+            nonlocal calls
+            calls += 1
+            async with scheduler.slot():
+                await asyncio.sleep(0.01)
+            return "result"
+
+        async def caller(session):
+            jobs.set_owner(session)
+            return await flight.run("key", call)
+
+        results = await asyncio.gather(*(caller(f"s{n}") for n in range(30)))
+        assert calls == 1
+        assert set(results) == {"result"}
+
+    asyncio.run(main())
+
+
+def test_shared_calls_respect_the_starting_session_limit():
+    async def main():
+        scheduler, flight = _flight(max_per_session=1)
+        running = 0
+        peak = 0
+
+        async def call():
+            nonlocal running, peak
+            async with scheduler.slot():
+                running += 1
+                peak = max(peak, running)
+                await asyncio.sleep(0.01)
+                running -= 1
+
+        jobs.set_owner("a")
+        await asyncio.gather(*(flight.run(f"key{n}", call) for n in range(8)))
+        assert peak == 1
+
+    asyncio.run(main())
+
+
+def test_cancelling_one_session_leaves_the_call_for_others():
+    async def main():
+        scheduler, flight = _flight()
+        started = asyncio.Event()
+
+        async def call():
+            async with scheduler.slot(tag="x"):
+                started.set()
+                await asyncio.sleep(0.05)
+            return "result"
+
+        async def caller(session):
+            jobs.set_owner(session)
+            return await flight.run("key", call, "x")
+
+        first = asyncio.create_task(caller("a"))
+        second = asyncio.create_task(caller("b"))
+        await started.wait()
+        scheduler.cancel("a", "x")
+        results = await asyncio.gather(first, second, return_exceptions=True)
+        assert isinstance(results[0], asyncio.CancelledError)
+        assert results[1] == "result"
+
+    asyncio.run(main())
+
+
+def test_cancelling_one_session_leaves_a_queued_call_for_others():
+    async def main():
+        scheduler, flight = _flight(max_running=1)
+        blocker_started = asyncio.Event()
+
+        async def blocker():
+            jobs.set_owner("c")
+            async with scheduler.slot():
+                blocker_started.set()
+                await asyncio.sleep(0.05)
+
+        async def call():
+            async with scheduler.slot(tag="x"):
+                await asyncio.sleep(0.01)
+            return "result"
+
+        async def caller(session):
+            jobs.set_owner(session)
+            return await flight.run("key", call, "x")
+
+        running = asyncio.create_task(blocker())
+        await blocker_started.wait()
+        first = asyncio.create_task(caller("a"))
+        second = asyncio.create_task(caller("b"))
+        await asyncio.sleep(0.01)
+        assert scheduler.queue_depth == 1
+        scheduler.cancel("a", "x")
+        results = await asyncio.gather(first, second, return_exceptions=True)
+        await running
+        assert isinstance(results[0], asyncio.CancelledError)
+        assert results[1] == "result"
+
+    asyncio.run(main())
+
+
+def test_abandoned_call_is_cancelled():
+    async def main():
+        scheduler, flight = _flight()
+        cancelled = asyncio.Event()
+
+        async def call():
+            try:
+                await asyncio.sleep(1)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        jobs.set_owner("a")
+        task = asyncio.create_task(flight.run("key", call, "x"))
+        await asyncio.sleep(0.01)
+        scheduler.cancel("a", "x")
+        await asyncio.gather(task, return_exceptions=True)
+        await asyncio.wait_for(cancelled.wait(), 1)
+        assert not flight._calls
+
+    asyncio.run(main())
+
+
+def test_stream_replays_to_late_joiners():
+    async def main():
+        _, flight = _flight()
+        calls = 0
+
+        async def chunks():
+            nonlocal calls
+            calls += 1
+            for text in "abcd":
+                await asyncio.sleep(0.01)
+                yield text
+
+        async def reader(delay):
+            await asyncio.sleep(delay)
+            return "".join([text async for text in flight.stream("key", chunks)])
+
+        results = await asyncio.gather(reader(0), reader(0.025))
+        assert calls == 1
+        assert results == ["abcd", "abcd"]
+
+    asyncio.run(main())